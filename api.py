@@ -1,5 +1,64 @@
 import os
 import requests
+from circuit_breaker import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded, OPEN_SECONDS
+from news_cache import NewsCache, session, TIMEOUT
+
+# headlines shared by the container and across containers through DynamoDB, served stale
+# while one refresh runs, see news_cache.py
+news_cache = NewsCache()
+
+
+def newsapi_failure(e):
+    # 4xx other than rate limiting is our request, not NewsAPI being down
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return True
+
+
+# the same breaker name as lambda/news.py, with CIRCUIT_BREAKER_TABLE set both functions
+# see NewsAPI being down
+newsapi_breaker = CircuitBreaker("newsapi", is_failure=newsapi_failure)
+
+URL = "https://newsapi.org/v2/top-headlines"
+
+
+def cache_key(country, category):
+    # the body here is str() of the NewsAPI payload, lambda/news.py stores JSON under top-headlines:*
+    return f"api:top-headlines:{country}:{category}"
+
+
+def fallback(key, message, retry_after=OPEN_SECONDS):
+    # last headlines whatever their age, better than an error for a news feed
+    entry = news_cache.peek(key)
+    if entry is not None:
+        return {
+            "statusCode": 200,
+            "body": entry.body,
+            "headers": {"Warning": '110 - "Response is Stale"'}
+        }
+    return {
+        "statusCode": 503,
+        "body": message,
+        "headers": {"Retry-After": str(int(retry_after))}
+    }
+
+
+def fetch_headlines(news_api_key, country, category, deadline):
+    # never wait on NewsAPI past the invocation's own timeout
+    left = deadline.timeout(sum(TIMEOUT))
+    params = {
+        "apiKey": news_api_key,
+        "country": country,
+        "category": category
+    }
+
+    def get():
+        response = session.get(URL, params=params, timeout=(min(TIMEOUT[0], left), min(TIMEOUT[1], left)))
+        response.raise_for_status()
+        return response
+
+    return str(newsapi_breaker.call(get).json())
+
 
 def lambda_handler(event, context):
     """
@@ -13,27 +72,20 @@ def lambda_handler(event, context):
             "body": "NewsAPI key not found in environment variables."
         }
 
-    # Set the API endpoint and parameters
-    url = "https://newsapi.org/v2/top-headlines"
-    params = {
-        "apiKey": news_api_key,
-        "country": "us",
-        "category": "health"
-    }
-
-    # Make the API request
+    deadline = Deadline(context)
+    key = cache_key("us", "health")
+    # Make the API request, unless the headlines are fresh or a stale copy can be served
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        entry = news_cache.get(key, lambda: fetch_headlines(news_api_key, "us", "health", deadline))
+    except CircuitOpen as e:
+        return fallback(key, str(e), e.retry_after)
+    except DeadlineExceeded as e:
+        return fallback(key, f"No time left to fetch news: {str(e)}")
     except requests.exceptions.RequestException as e:
-        return {
-            "statusCode": 500,
-            "body": f"Error fetching news: {str(e)}"
-        }
+        return fallback(key, f"Error fetching news: {str(e)}")
 
     # Return the response
     return {
         "statusCode": 200,
-        "body": str(data)
+        "body": entry.body
     }
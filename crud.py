@@ -1,9 +1,18 @@
 import boto3
+from urllib.parse import unquote_plus
 from botocore.exceptions import ClientError
+from label_index import index_image_labels
+from variant_keys import is_variant
 
-def lambda_handler(event, context):
+# S3 trigger of the image bucket, configure the function with the handler crud.labels_handler.
+# lambda_handler further down is the chat handler, the two share this file.
+def labels_handler(event, context):
     bucket = event['Records'][0]['s3']['bucket']['name']
-    key = event['Records'][0]['s3']['object']['key']
+    key = unquote_plus(event['Records'][0]['s3']['object']['key'])
+
+    # the only producer of the label index, resized variants are the same image
+    if is_variant(key):
+        return {"statusCode": 200, "body": {"labels": []}}
     
     # Create the Rekognition client
     rekognition = boto3.client('rekognition')
@@ -21,6 +30,16 @@ def lambda_handler(event, context):
             MinConfidence=70
         )
         
+        labels = [
+            {
+                "name": label['Name'],
+                "confidence": label['Confidence']
+            } for label in response['Labels']
+        ]
+
+        # keep the labels so images can be found by label without analyzing them again
+        index_image_labels(bucket, key, labels)
+
         # Prepare the response for API Gateway
         api_response = {
             "statusCode": 200,
@@ -28,12 +47,7 @@ def lambda_handler(event, context):
                 "Content-Type": "application/json"
             },
             "body": {
-                "labels": [
-                    {
-                        "name": label['Name'],
-                        "confidence": label['Confidence']
-                    } for label in response['Labels']
-                ]
+                "labels": labels
             }
         }
         
@@ -49,50 +63,128 @@ def lambda_handler(event, context):
 # bedrock
 import os
 import json
+import time
 import boto3
-from langchain.llms import BedrockedLLM
-from langchain.prompts import PromptTemplate
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationEntityMemory
+from collections import OrderedDict
 
-def lambda_handler(event, context):
-    # Initialize the Bedrock client
-    bedrock = boto3.client('bedrock')
-
-    # Create the Bedrock-powered LLM
-    llm = BedrockedLLM(
-        bedrock_client=bedrock,
-        model_name='claude-v3',
-        temperature=0.7,
-        max_tokens=1024
-    )
-
-    # Define a prompt template for healthcare-related tasks
-    healthcare_prompt = PromptTemplate(
-        input_variables=["history", "query"],
-        template="You are an AI assistant specializing in healthcare. The conversation history is: {history}. Please provide a response to the following query: {query}"
-    )
+# langchain is slow to import and the llm client, prompt and chain are the same for every
+# request, so they are imported and built on first use and then reused by the container.
+# Conversation history lives in DynamoDB, one item per message, and only the last
+# MEMORY_WINDOW exchanges are read back for each request.
 
-    # Get the user's message and user ID from the event
-    user_message = event['message']
-    user_id = event['user_id']
+MEMORY_TABLE_NAME = os.environ.get("MEMORY_TABLE_NAME", "conversation_memory")
+MEMORY_WINDOW = int(os.environ.get("MEMORY_WINDOW", "5"))
+# a text completion model, langchain_community's Bedrock LLM rejects the Claude 3 messages models
+CHAT_MODEL_ID = os.environ.get("CHAT_MODEL_ID", "anthropic.claude-v2:1")
+# per-user chains kept by the container, their state is in DynamoDB so evicting one only costs a rebuild
+MAX_CACHED_CHAINS = 128
+
+_components = {}
+_chains = OrderedDict()
+memory_table = boto3.resource('dynamodb').Table(MEMORY_TABLE_NAME)
+
+
+def get_components():
+    """
+    Imports langchain and builds the llm and prompt once per container.
+    """
+    if not _components:
+        from langchain_community.llms import Bedrock
+        from langchain.prompts import PromptTemplate
+        from langchain.chains import ConversationChain
+        from langchain.memory import ConversationBufferWindowMemory
+        from langchain.schema import BaseChatMessageHistory, messages_from_dict, messages_to_dict
+
+        class WindowedDynamoDBHistory(BaseChatMessageHistory):
+            """
+            Chat history of one user, reads only the most recent messages with a reverse Query.
+            """
+
+            def __init__(self, user_id, window):
+                self.user_id = user_id
+                self.window = window
+
+            @property
+            def messages(self):
+                from boto3.dynamodb.conditions import Key
+                response = memory_table.query(
+                    KeyConditionExpression=Key('user_id').eq(self.user_id),
+                    ScanIndexForward=False,
+                    Limit=self.window * 2
+                )
+                items = list(reversed(response.get('Items', [])))
+                return messages_from_dict([json.loads(item['message']) for item in items])
 
-    # Create the conversation memory for the user
-    conversation_memory = ConversationEntityMemory(k=5, entity_key="user_id")
-    conversation_memory.save_context({"user_id": user_id}, user_message)
+            def add_message(self, message):
+                memory_table.put_item(Item={
+                    'user_id': self.user_id,
+                    'time_creation': time.time_ns(),
+                    'message': json.dumps(messages_to_dict([message])[0]),
+                })
 
-    # Create the ConversationChain with the healthcare prompt and memory
-    healthcare_chain = ConversationChain(
-        llm=llm,
-        prompt=healthcare_prompt,
-        memory=conversation_memory
-    )
+            def clear(self):
+                from boto3.dynamodb.conditions import Key
+                params = {
+                    'KeyConditionExpression': Key('user_id').eq(self.user_id),
+                    'ProjectionExpression': "user_id, time_creation",
+                }
+                with memory_table.batch_writer() as batch:
+                    while True:
+                        response = memory_table.query(**params)
+                        for item in response.get('Items', []):
+                            batch.delete_item(Key={'user_id': item['user_id'], 'time_creation': item['time_creation']})
+                        if 'LastEvaluatedKey' not in response:
+                            break
+                        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        # Create the Bedrock-powered LLM
+        _components["llm"] = Bedrock(
+            client=boto3.client('bedrock-runtime'),
+            model_id=CHAT_MODEL_ID,
+            model_kwargs={"temperature": 0.7, "max_tokens_to_sample": 1024}
+        )
+        # Define a prompt template for healthcare-related tasks
+        _components["prompt"] = PromptTemplate(
+            input_variables=["history", "input"],
+            template="You are an AI assistant specializing in healthcare. The conversation history is: {history}. Please provide a response to the following query: {input}"
+        )
+        _components["ConversationChain"] = ConversationChain
+        _components["ConversationBufferWindowMemory"] = ConversationBufferWindowMemory
+        _components["History"] = WindowedDynamoDBHistory
+    return _components
+
+
+def get_chain(user_id):
+    """
+    Returns the user's ConversationChain, built on first use.
+    """
+    chain = _chains.get(user_id)
+    if chain is None:
+        components = get_components()
+        memory = components["ConversationBufferWindowMemory"](
+            k=MEMORY_WINDOW,
+            chat_memory=components["History"](user_id, MEMORY_WINDOW)
+        )
+        chain = components["ConversationChain"](
+            llm=components["llm"],
+            prompt=components["prompt"],
+            memory=memory
+        )
+        _chains[user_id] = chain
+        if len(_chains) > MAX_CACHED_CHAINS:
+            _chains.popitem(last=False)
+    _chains.move_to_end(user_id)
+    return chain
 
-    # Generate a response using the healthcare chain
-    response = healthcare_chain.predict(input=user_message)
 
-    # Update the conversation memory
-    healthcare_chain.save_context({"query": user_message, "user_id": user_id}, response)
+def lambda_handler(event, context):
+    # Get the user's message and user ID from the event
+    user_message = event['message']
+    user_id = event['user_id']
+
+    # Generate a response using the healthcare chain, the memory loads the recent
+    # history before the call and saves this exchange after it
+    response = get_chain(user_id).predict(input=user_message)
 
     # Prepare the response for API Gateway
     api_response = {
@@ -106,4 +198,3 @@ def lambda_handler(event, context):
     }
 
     return api_response
-
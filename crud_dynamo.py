@@ -1,8 +1,13 @@
+import os
 import boto3
 from botocore.exceptions import ClientError
 import logging
 import json
 import uuid
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from parallel_scan import scan_items
+from retry import DYNAMODB_THROTTLE_CODES, sleep_backoff
 
 # Configure the logger
 logging = logging.getLogger()
@@ -15,6 +20,18 @@ dynamodb = session.resource("dynamodb")
 table_name = "Items"
 table = dynamodb.Table(table_name)
 
+# segments scanned in parallel, see parallel_scan.py
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "8"))
+
+# bulk routes (resource ending in /batch): POST creates, PUT replaces whole items, DELETE removes by id
+MAX_BATCH_ITEMS = 5000
+# BatchWriteItem takes at most 25 requests
+CHUNK_SIZE = 25
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+MAX_ATTEMPTS = 8
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 2
+
 # Function to create an item in the table
 def create_item(data):
     try:
@@ -44,9 +61,9 @@ def get_item(item_id):
 # Function to get all items from the table
 def get_item_all():
     try:
-        response = table.scan()
-        items = response.get('Items')
-        if items is not None and len(items) > 0:
+        # the whole table, a single scan call stopped at the first 1 MB page
+        items = list(scan_items(table, SCAN_SEGMENTS))
+        if len(items) > 0:
             logging.info(f"Found {len(items)} items")
             return {"statusCode": 200, "body": json.dumps(items)}
         else:
@@ -86,9 +103,101 @@ def delete_item(item_id):
         logging.error(f"Error deleting item: {e}")
         return {"statusCode": 500, "body": json.dumps(f"Error deleting item: {e}")}
 
+def write_chunk(requests):
+    """
+    Sends up to 25 put/delete requests, retrying what DynamoDB leaves unprocessed.
+
+    Args:
+        requests: [(item id, {"PutRequest": ...} or {"DeleteRequest": ...})]
+    Returns:
+        {item id: error message} of the requests that were not written
+    """
+    pending = dict(requests)
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = dynamodb.batch_write_item(RequestItems={table_name: list(pending.values())})
+        except ClientError as e:
+            if e.response['Error']['Code'] not in DYNAMODB_THROTTLE_CODES:
+                return {item_id: str(e) for item_id in pending}
+            unprocessed = list(pending.values())
+        else:
+            unprocessed = response.get('UnprocessedItems', {}).get(table_name, [])
+        if not unprocessed:
+            return {}
+        pending = {request_id(request): request for request in unprocessed}
+        sleep_backoff(attempt, BASE_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+    logging.error(f"{len(pending)} items still unprocessed after {MAX_ATTEMPTS} attempts")
+    return {item_id: "Unprocessed after retries, throughput exceeded" for item_id in pending}
+
+def request_id(request):
+    if "PutRequest" in request:
+        return request["PutRequest"]["Item"]["id"]
+    return request["DeleteRequest"]["Key"]["id"]
+
+def batch_write(http_method, data):
+    """
+    Writes a list of items with BatchWriteItem, 25 per call and BATCH_CONCURRENCY calls at a time.
+
+    POST   {"items": [{...}]}            creates, ids are generated
+    PUT    {"items": [{"id": ..., ...}]}  replaces whole items, BatchWriteItem cannot update attributes
+    DELETE {"ids": [...]}
+
+    Returns one result per input entry, in input order: {"id", "status": "ok" | "failed", "error"}.
+    """
+    entries = data.get("ids" if http_method == "DELETE" else "items")
+    if not isinstance(entries, list) or not entries or len(entries) > MAX_BATCH_ITEMS:
+        return {"statusCode": 400, "body": json.dumps(f"Expected a list of 1 to {MAX_BATCH_ITEMS} entries")}
+
+    results = []
+    requests = []
+    seen = set()
+    for entry in entries:
+        if http_method == "DELETE":
+            item_id = entry if isinstance(entry, str) else None
+            request = {"DeleteRequest": {"Key": {"id": item_id}}}
+        elif not isinstance(entry, dict):
+            item_id, request = None, None
+        else:
+            item = dict(entry)
+            if http_method == "POST":
+                item["id"] = str(uuid.uuid4())  # Generate a unique ID for the item
+            item_id = item.get("id")
+            request = {"PutRequest": {"Item": item}}
+        result = {"id": item_id, "status": "ok"}
+        results.append(result)
+        if not isinstance(item_id, str) or not item_id:
+            result.update(status="failed", error="Entry needs a string id" if http_method != "POST" else "Entry must be an object")
+        elif item_id in seen:
+            # a BatchWriteItem call rejects two requests for the same key
+            result.update(status="failed", error="Duplicate id in request")
+        else:
+            seen.add(item_id)
+            requests.append((item_id, request))
+
+    chunks = [requests[i:i + CHUNK_SIZE] for i in range(0, len(requests), CHUNK_SIZE)]
+    errors = {}
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
+        for chunk_errors in executor.map(write_chunk, chunks):
+            errors.update(chunk_errors)
+    for result in results:
+        if result["status"] == "ok" and result["id"] in errors:
+            result.update(status="failed", error=errors[result["id"]])
+
+    failed = sum(1 for result in results if result["status"] == "failed")
+    logging.info(f"Batch {http_method}: {len(results) - failed} written, {failed} failed")
+    return {
+        # 207 when only some entries were written, see the per entry status
+        "statusCode": 200 if not failed else 207,
+        "body": json.dumps({"succeeded": len(results) - failed, "failed": failed, "results": results})
+    }
+
 def lambda_handler(event, context):
     try:
         http_method = event.get("httpMethod")
+        if event.get("resource", "").endswith("/batch") and http_method in ("POST", "PUT", "DELETE"):
+            # DynamoDB does not take floats
+            data = json.loads(event["body"], parse_float=Decimal)
+            return batch_write(http_method, data)
         if http_method == "POST":
             data = json.loads(event["body"])
             return create_item(data)
@@ -0,0 +1,61 @@
+import io
+import boto3
+from PIL import Image, ImageOps
+from variant_keys import VARIANT_FORMATS, variant_key
+
+# Resized variants of uploaded images, made by lambda-handle-sqs.py when an upload lands.
+# Needs Pillow in the deployment package (e.g. a Pillow layer).
+
+s3 = boto3.client('s3')
+
+# name -> (longest side in pixels, quality), formats and keys are in variant_keys.py
+VARIANTS = {
+    "thumbnail": (160, 75),
+    "feed": (1080, 80),
+    "analysis": (1600, 90),
+}
+CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+def resize(image, longest_side):
+    # thumbnail keeps the aspect ratio and never upscales
+    image.thumbnail((longest_side, longest_side), Image.LANCZOS)
+    return image
+
+
+def create_variants(bucket_name, object_key, names=None):
+    """
+    Writes the resized variants of s3://bucket_name/object_key next to it.
+
+    Returns:
+        dict of variant name -> key
+    """
+    names = names or list(VARIANTS)
+    original = s3.get_object(Bucket=bucket_name, Key=object_key)['Body'].read()
+    image = Image.open(io.BytesIO(original))
+    largest = max(VARIANTS[name][0] for name in names)
+    # JPEG can decode at 1/2, 1/4 or 1/8 scale directly, much cheaper than decoding full size
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+
+    keys = {}
+    for name in sorted(names, key=lambda n: -VARIANTS[n][0]):
+        longest_side, quality = VARIANTS[name]
+        image_format = VARIANT_FORMATS[name]
+        # resize from the previous, larger variant rather than the original
+        image = resize(image, longest_side)
+        output = image if image_format != "JPEG" or image.mode == "RGB" else image.convert("RGB")
+        buffer = io.BytesIO()
+        output.save(buffer, format=image_format, quality=quality, optimize=True)
+        key = variant_key(object_key, name)
+        s3.put_object(
+            Bucket=bucket_name,
+            Key=key,
+            Body=buffer.getvalue(),
+            ContentType=CONTENT_TYPES[image_format],
+            CacheControl="public, max-age=31536000, immutable"
+        )
+        keys[name] = key
+    return keys
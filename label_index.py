@@ -0,0 +1,61 @@
+import os
+import boto3
+from decimal import Decimal
+
+# Inverted index of rekognition labels: label -> images, read by lambda/labels.py.
+#
+# Table LABEL_INDEX_TABLE, partition key "label", sort key "sk".
+# Index items:  label=<label>,            sk="<confidence 000.00>#<bucket>/<key>"
+# Image items:  label="__image__#<bucket>/<key>", sk="labels", entries=["<label>|<sk>" of every index item]
+# The sort key starts with the zero padded confidence so "above a threshold" is a key
+# condition and results come back most confident first. The image item lists what was
+# indexed for an image so re-analysis replaces its entries instead of adding duplicates.
+
+dynamodb = boto3.resource('dynamodb')
+label_index_table = dynamodb.Table(os.environ.get('LABEL_INDEX_TABLE', 'image_labels'))
+
+IMAGE_ITEM_PREFIX = "__image__#"
+
+
+def normalize_label(name):
+    return name.strip().lower()
+
+
+def index_sort_key(confidence, bucket, key):
+    return f"{confidence:06.2f}#{bucket}/{key}"
+
+
+def index_image_labels(bucket, key, labels):
+    """
+    Replaces the index entries of an image.
+
+    Args:
+        labels: [{"name": str, "confidence": float}]
+    """
+    image_id = f"{IMAGE_ITEM_PREFIX}{bucket}/{key}"
+    previous = label_index_table.get_item(Key={'label': image_id, 'sk': 'labels'}).get('Item', {})
+
+    entries = []
+    items = []
+    for label in labels:
+        name = normalize_label(label['name'])
+        sk = index_sort_key(label['confidence'], bucket, key)
+        entries.append(f"{name}|{sk}")
+        items.append({
+            'label': name,
+            'sk': sk,
+            'bucket': bucket,
+            'image_key': key,
+            'confidence': Decimal(str(round(label['confidence'], 2))),
+        })
+    stale = set(previous.get('entries', [])) - set(entries)
+
+    with label_index_table.batch_writer(overwrite_by_pkeys=['label', 'sk']) as batch:
+        for entry in stale:
+            name, sk = entry.split("|", 1)
+            batch.delete_item(Key={'label': name, 'sk': sk})
+        for item in items:
+            batch.put_item(Item=item)
+        batch.put_item(Item={'label': image_id, 'sk': 'labels', 'entries': entries})
+    return len(items)
+
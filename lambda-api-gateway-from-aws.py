@@ -2,6 +2,7 @@ import boto3
 from botocore.exceptions import ClientError
 import logging
 import json
+from projection import parse_fields
 
 # AWS Lambda Function Logging in Python - https://docs.aws.amazon.com/lambda/latest/dg/python-logging.html
 logger = logging.getLogger()
@@ -16,14 +17,15 @@ table_name = "vehicles"
 table = dynamodb.Table(table_name)
 
 
-def query_item(id):
+def query_item(id, fields=None):
     try:
         ret = table.get_item(
-         Key={'id': id}
+         Key={'id': id},
+         **(fields.projection() if fields else {})
         )
         logger.info({"operation": "query a pet ", "details": ret})
         # Return the Item - https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb.html#DynamoDB.Client.get_item
-        return None, ret['Item']
+        return None, fields.trim(ret['Item']) if fields else ret['Item']
         
     except ClientError as err:
          logger.debug({"operation": "query a pet error ", "details": err})
@@ -43,7 +45,10 @@ def lambda_handler(event, context):
     # /pets/petId find pet by Id
     if (resource == "/vehicles/{id}"):
         petId = event['pathParameters']['id']
-        err, item = query_item(petId)
+        try:
+            err, item = query_item(petId, parse_fields(event.get('queryStringParameters')))
+        except ValueError as e:
+            err = e
     else:
         err = 'This Lambda Function only work for Find Pet Detail, check for another Lambda Function'
         item = None
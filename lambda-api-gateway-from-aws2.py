@@ -1,7 +1,10 @@
+import os
 import boto3
 from botocore.exceptions import ClientError
 import logging
 import json
+from parallel_scan import scan_items
+from projection import parse_fields
 
 # AWS Lambda Function Logging in Python - https://docs.aws.amazon.com/lambda/latest/dg/python-logging.html
 logger = logging.getLogger()
@@ -14,22 +17,19 @@ table_name = "vehicles"
 
 table = dynamodb.Table(table_name)
 
+# segments scanned in parallel, see parallel_scan.py
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "8"))
 
-def scan_table():
-    try:
-        result_item = []
-        result_data = table.scan()
-
-        result_item.extend(result_data['Items'])
 
+def scan_table(fields=None):
+    try:
         # Pagination https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Scan.html#Scan.Pagination
-        while 'LastEvaluatedKey' in result_data:
-            result_data = table.scan(
-                ExclusiveStartKey=result_data['LastEvaluatedKey']
-            )
-            result_item.extend(result_data['Items'])
+        # every segment is paginated on its own thread
+        result_item = list(scan_items(table, SCAN_SEGMENTS, **(fields.projection() if fields else {})))
+        if fields:
+            result_item = [fields.trim(item) for item in result_item]
 
-        logger.info({"operation": "scan pets ", "details": result_item})
+        logger.info({"operation": "scan pets ", "details": f"{len(result_item)} items"})
 
         return None, result_item
     except ClientError as err:
@@ -48,7 +48,11 @@ def lambda_handler(event, context):
     err = None
     # /pets List all pets
     if (resource == "/vehicles"):
-        err, items = scan_table()
+        try:
+            fields = parse_fields(event.get('queryStringParameters'))
+            err, items = scan_table(fields)
+        except ValueError as e:
+            err = e
 
     # /pets/petId find pet by Id
     else:
@@ -2,12 +2,78 @@ import json
 import boto3
 from boto3.dynamodb.conditions import Key
 import os
+from urllib.parse import unquote_plus
+from image_variants import create_variants
+from variant_keys import is_variant
 # Initialize DynamoDB and SQS resources
 dynamodb = boto3.resource('dynamodb')
 sqs = boto3.client('sqs')
+s3 = boto3.client('s3')
 SQS_QUEUE_URL = os.environ['SQS_QUEUE_URL']
 DYNAMODB_TABLE_NAME = os.environ['DYNAMODB_TABLE_NAME']
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+users_table = dynamodb.Table(os.environ.get('USERS_TABLE_NAME', 'users'))
+
+# uploads made with the presigned urls from lambda/upload-url.py are finalized here
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+PROFILE_IMAGE_PREFIX = "profile_images/"
+# prefixes lambda/upload-url.py hands out presigned urls for, other keys are never size checked or deleted
+UPLOAD_PREFIXES = (PROFILE_IMAGE_PREFIX, "image_rekognition/")
+
+
+def finalize_upload(bucket_name, object_key, object_size, event_time):
+    """
+    Applies a direct-to-S3 upload to the record it belongs to.
+    Keys look like profile_images/<user id>/<uuid>.<ext>
+    """
+    if object_key.startswith(UPLOAD_PREFIXES) and object_size > MAX_IMAGE_BYTES:
+        # presigned PUT urls can't enforce a size limit, drop oversized objects here
+        print(f"Deleting oversized upload {object_key} ({object_size} bytes)")
+        s3.delete_object(Bucket=bucket_name, Key=object_key)
+        return False
+
+    if object_key.startswith(PROFILE_IMAGE_PREFIX):
+        user_id = object_key.split("/")[1]
+        image_url = f"https://{bucket_name}.s3.amazonaws.com/{object_key}"
+        try:
+            # only move forward in time, notifications can arrive out of order
+            users_table.update_item(
+                Key={'id': user_id},
+                UpdateExpression="SET profile_image_url = :url, profile_image_time = :time",
+                ConditionExpression="attribute_exists(id) AND (attribute_not_exists(profile_image_time) OR profile_image_time < :time)",
+                ExpressionAttributeValues={':url': image_url, ':time': event_time}
+            )
+            print(f"profile_image_url of {user_id} set to {image_url}")
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            print(f"Skipped {object_key}, user missing or a newer profile image exists")
+    return True
+
+
+def save_variants(bucket_name, object_key):
+    """
+    Creates the resized variants and points the owning record at them.
+    """
+    try:
+        variants = create_variants(bucket_name, object_key)
+    except Exception as e:
+        print(f"Error creating variants of {object_key}: {e}")
+        return {}
+    if object_key.startswith(PROFILE_IMAGE_PREFIX):
+        user_id = object_key.split("/")[1]
+        image_url = f"https://{bucket_name}.s3.amazonaws.com/{object_key}"
+        variant_urls = {name: f"https://{bucket_name}.s3.amazonaws.com/{key}" for name, key in variants.items()}
+        try:
+            # only if this upload is still the current profile image
+            users_table.update_item(
+                Key={'id': user_id},
+                UpdateExpression="SET profile_image_variants = :variants",
+                ConditionExpression="profile_image_url = :url",
+                ExpressionAttributeValues={':variants': variant_urls, ':url': image_url}
+            )
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            print(f"Skipped variants of {object_key}, no longer the profile image")
+    return variants
+
 
 def lambda_handler(event, context):
     print("event = ")
@@ -25,21 +91,37 @@ def lambda_handler(event, context):
             print(message)
             # Extracting the bucket name and object key
             bucket_name = message["Records"][0]["s3"]["bucket"]["name"]
-            object_key = message["Records"][0]["s3"]["object"]["key"]
+            # keys arrive url encoded, e.g. spaces as +
+            object_key = unquote_plus(message["Records"][0]["s3"]["object"]["key"])
+            object_size = message["Records"][0]["s3"]["object"].get("size", 0)
             event_time = message["Records"][0]["eventTime"]
             print("result : ")
             print(bucket_name)
             print(object_key)
             print(event_time)
+
+            # variants are written to the same bucket, their own notifications need no work
+            if is_variant(object_key):
+                print(f"Skipping variant {object_key}")
+                receipt_handle = record['receiptHandle']
+                sqs.delete_message(
+                    QueueUrl=SQS_QUEUE_URL,
+                    ReceiptHandle=receipt_handle
+                )
+                continue
             
             # Save the image information to the DynamoDB table
             try:
+                if not finalize_upload(bucket_name, object_key, object_size, event_time):
+                    raise ValueError(f"upload {object_key} rejected")
+                variants = save_variants(bucket_name, object_key)
                 table.put_item(
                     Item={
                         'id': record['messageId'],
                         'Bucket': bucket_name,
                         'ObjectKey': object_key,
-                        'EventTime': event_time
+                        'EventTime': event_time,
+                        'Variants': variants
                     }
                 )
                 print(f"Image information saved to DynamoDB: Bucket={bucket_name}, ObjectKey={object_key}, EventTime={event_time}")
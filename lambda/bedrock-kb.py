@@ -1,12 +1,42 @@
 import os
 import boto3
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from bedrock_metrics import emit_metrics, Stopwatch
+from retry import AdaptiveLimiter, sleep_backoff
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+# batch mode, questions answered concurrently with backoff when bedrock throttles
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+MAX_BATCH_SIZE = 500
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 20
+THROTTLE_CODES = ("ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException")
+
+# semantic answer cache for questions asked outside a conversation, needs numpy in the deployment package
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+if SEMANTIC_CACHE_ENABLED:
+    from semantic_cache import SemanticCache, embed
+    semantic_cache = SemanticCache()
 
 
 boto3_session = boto3.session.Session()
 region = boto3_session.region_name
 
-# create a boto3 bedrock client
-bedrock_agent_runtime_client = boto3.client('bedrock-agent-runtime')
+# create a boto3 bedrock client, KB_BACKEND=local answers from a local vector store instead (see local_kb.py)
+KB_BACKEND = os.environ.get("KB_BACKEND", "bedrock")
+if KB_BACKEND == "local":
+    from local_kb import LocalAgentRuntimeClient, LocalVectorStore, EMBEDDERS
+    bedrock_agent_runtime_client = LocalAgentRuntimeClient(
+        LocalVectorStore(embedder=EMBEDDERS[os.environ.get("LOCAL_KB_EMBEDDER", "hashing")]())
+    )
+else:
+    bedrock_agent_runtime_client = boto3.client('bedrock-agent-runtime')
 
 # get knowledge base id from environment variable
 kb_id = os.environ.get("KNOWLEDGE_BASE_ID")
@@ -28,70 +58,296 @@ $query$
 if you're asked in different language other than english , please answer it in that language as well.
 Assistant:
 """
+# retrieval settings a caller may override per request
+DEFAULT_NUMBER_OF_RESULTS = 5
+MAX_NUMBER_OF_RESULTS = 100
+SEARCH_TYPES = ("SEMANTIC", "HYBRID")
+MODES = ("generate", "retrieve")
+
+
+def validate_retrieval_params(event):
+    """
+    Reads the optional retrieval settings from the event and validates them.
+
+    Returns:
+        (error, params) where error is a message or None
+    """
+    mode = event.get("mode", "generate")
+    if mode not in MODES:
+        return f"mode must be one of {MODES}", None
+
+    numberOfResults = event.get("numberOfResults", DEFAULT_NUMBER_OF_RESULTS)
+    try:
+        numberOfResults = int(numberOfResults)
+    except (TypeError, ValueError):
+        return "numberOfResults must be an integer", None
+    if not 1 <= numberOfResults <= MAX_NUMBER_OF_RESULTS:
+        return f"numberOfResults must be between 1 and {MAX_NUMBER_OF_RESULTS}", None
+
+    searchType = event.get("searchType")
+    if searchType is not None:
+        searchType = str(searchType).upper()
+        if searchType not in SEARCH_TYPES:
+            return f"searchType must be one of {SEARCH_TYPES}", None
+
+    template = event.get("promptTemplate", promptTemplate)
+    # the knowledge base rejects templates without the search results placeholder
+    if not isinstance(template, str) or "$search_results$" not in template:
+        return "promptTemplate must contain $search_results$", None
+
+    # clients send the string "None" when there is no conversation yet
+    sessionId = event.get("sessionid")
+    if sessionId in (None, "", "None"):
+        sessionId = None
+
+    return None, {
+        "mode": mode,
+        "numberOfResults": numberOfResults,
+        "searchType": searchType,
+        "promptTemplate": template,
+        "sessionId": sessionId,
+    }
+
+
+def retrievalConfiguration(numberOfResults, searchType=None):
+    vectorSearchConfiguration = {'numberOfResults': numberOfResults}
+    if searchType:
+        vectorSearchConfiguration['overrideSearchType'] = searchType
+    return {'vectorSearchConfiguration': vectorSearchConfiguration}
+
+
 # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-agent-runtime/client/retrieve_and_generate.html
 # https://aws.amazon.com/blogs/machine-learning/knowledge-bases-for-amazon-bedrock-now-supports-custom-prompts-for-the-retrieveandgenerate-api-and-configuration-of-the-maximum-number-of-retrieved-results/
-def retrieveAndGenerate(input, kbId,numberOfResults,promptTemplate, model_arn, sessionId=None):
+def retrieveAndGenerate(input, kbId, numberOfResults, promptTemplate, model_arn, sessionId=None, searchType=None):
     print(input, kbId, model_arn)
-    if sessionId != "None":
-        return bedrock_agent_runtime_client.retrieve_and_generate(
-            input={
-                'text': input
-            },
-            retrieveAndGenerateConfiguration={
-                'type': 'KNOWLEDGE_BASE',
-                'knowledgeBaseConfiguration': {
-                    'knowledgeBaseId': kbId,
-                    'modelArn': model_arn,
-                    # 'retrievalConfiguration': {
-                    #     'vectorSearchConfiguration': {
-                    #         'numberOfResults': numberOfResults,
-                    #         'overrideSearchType': "SEMANTIC", # optional'
-                    #     }
-                    # },
-                    # 'generationConfiguration': {
-                    #     'promptTemplate': {
-                    #         'textPromptTemplate': promptTemplate
-                    #     }
-                    # }
-                }
-            },
-            sessionId=sessionId
-        )
-    else:
-        return bedrock_agent_runtime_client.retrieve_and_generate(
-            input={
-                'text': input
-            },
-            retrieveAndGenerateConfiguration={
-                'type': 'KNOWLEDGE_BASE',
-                'knowledgeBaseConfiguration': {
-                    'knowledgeBaseId': kbId,
-                    'modelArn': model_arn,
-                    # 'retrievalConfiguration': {
-                    #     'vectorSearchConfiguration': {
-                    #         'numberOfResults': numberOfResults,
-                    #         'overrideSearchType': "SEMANTIC", # optional'
-                    #     }
-                    # },
-                    # 'generationConfiguration': {
-                    #     'promptTemplate': {
-                    #         'textPromptTemplate': promptTemplate
-                    #     }
-                    # }
+    request = {
+        'input': {
+            'text': input
+        },
+        'retrieveAndGenerateConfiguration': {
+            'type': 'KNOWLEDGE_BASE',
+            'knowledgeBaseConfiguration': {
+                'knowledgeBaseId': kbId,
+                'modelArn': model_arn,
+                'retrievalConfiguration': retrievalConfiguration(numberOfResults, searchType),
+                'generationConfiguration': {
+                    'promptTemplate': {
+                        'textPromptTemplate': promptTemplate
+                    }
                 }
             }
-        )
+        }
+    }
+    # sessionId is only valid when continuing an existing conversation
+    if sessionId:
+        request['sessionId'] = sessionId
+    return bedrock_agent_runtime_client.retrieve_and_generate(**request)
 
 
-def lambda_handler(event, context):
-    query = event["question"]
-    session_id = event["sessionid"]
-    numberOfResults = 12
-    response = retrieveAndGenerate(query, kb_id,numberOfResults,promptTemplate, model_arn, session_id)
+# https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-agent-runtime/client/retrieve.html
+def retrieve(input, kbId, numberOfResults, searchType=None):
+    """
+    Returns the ranked passages for the query without calling the model.
+    """
+    response = bedrock_agent_runtime_client.retrieve(
+        knowledgeBaseId=kbId,
+        retrievalQuery={
+            'text': input
+        },
+        retrievalConfiguration=retrievalConfiguration(numberOfResults, searchType)
+    )
+    passages = []
+    for result in response.get('retrievalResults', []):
+        passages.append({
+            "text": result['content']['text'],
+            "score": result.get('score'),
+            "location": result.get('location'),
+        })
+    return passages
+
+
+def cache_scope(params):
+    """
+    Answers are only reused for questions asked with the same retrieval settings.
+    """
+    template_hash = hashlib.sha1(params["promptTemplate"].encode("utf-8")).hexdigest()[:12]
+    return f"{kb_id}|{params['numberOfResults']}|{params['searchType']}|{template_hash}"
+
+
+def answer(query, params, user, cache=True, save_cache=True):
+    """
+    Answers one question with already validated params.
+
+    Returns:
+        the response body for the question
+    """
+    if params["mode"] == "retrieve":
+        with Stopwatch() as sw:
+            passages = retrieve(query, kb_id, params["numberOfResults"], params["searchType"])
+        # retrieve calls no model, the knowledge base is not a model id
+        emit_metrics("Retrieve", None, user, {
+            "RetrievalLatency": sw.elapsed_ms,
+            "RetrievedReferences": len(passages),
+        })
+        return {"question": query.strip(), "passages": passages}
+
+    # follow up questions depend on the conversation so they are never answered from the cache
+    use_cache = SEMANTIC_CACHE_ENABLED and params["sessionId"] is None and cache
+    if use_cache:
+        scope = cache_scope(params)
+        try:
+            vector = embed(query.strip())
+            cached, similarity = semantic_cache.lookup(vector, scope)
+        except Exception as e:
+            # the cache is an optimization, e.g. a throttled or disabled embedding model must not fail the question
+            print(f"Semantic cache unavailable, answering without it: {e}")
+            use_cache = False
+    if use_cache:
+        emit_metrics("SemanticCache", model_id, user, {
+            "CacheHit": 1 if cached else 0,
+            "CacheSimilarity": similarity,
+        })
+        if cached:
+            print(f"Semantic cache hit ({similarity:.3f}) for: {cached['question']}")
+            return {"question": query.strip(), "answer": cached["answer"], "sessionid": None, "cached": True}
+
+    with Stopwatch() as sw:
+        response = retrieveAndGenerate(query, kb_id, params["numberOfResults"], params["promptTemplate"],
+                                       model_arn, params["sessionId"], params["searchType"])
     generated_text = response['output']['text']
     print(generated_text)
+    if use_cache:
+        semantic_cache.add(vector, scope, query.strip(), generated_text.strip(), save=save_cache)
+
+    # retrieve_and_generate does not return token usage, record what the response does tell us
+    references = sum(len(citation.get('retrievedReferences', [])) for citation in response.get('citations', []))
+    # RetrieveAndGenerate returns no token usage, bedrock_usage_report.py lists these as unpriced
+    emit_metrics("RetrieveAndGenerate", model_id, user, {
+        "InvocationLatency": sw.elapsed_ms,
+        "RetrievedReferences": references,
+    })
+
+    return {"question": query.strip(), "answer": generated_text.strip(), "sessionid": response.get('sessionId')}
+
+
+def is_throttle(error):
+    return isinstance(error, ClientError) and error.response["Error"]["Code"] in THROTTLE_CODES
+
+
+def answer_with_backoff(query, params, user, limiter, cache):
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with limiter:
+                body = answer(query, params, user, cache=cache, save_cache=False)
+            limiter.success()
+            return body
+        except Exception as e:
+            if not is_throttle(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+            limiter.throttled()
+            sleep_backoff(attempt, BASE_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+
+
+def answer_batch(items, defaults, user, max_concurrency=BATCH_CONCURRENCY):
+    """
+    Answers a list of questions concurrently.
+
+    Each item is a question string or a dict with "question" and any of the
+    single question settings, which override the batch level defaults.
+
+    Returns:
+        one result per item in input order, {"answer"...} or {"error"...}
+    """
+    limiter = AdaptiveLimiter(max_concurrency, "Bedrock")
+
+    def run(item):
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict) or not item.get("question"):
+            return {"error": {"message": "question must be provided"}}
+        merged = dict(defaults)
+        merged.update(item)
+        try:
+            err, params = validate_retrieval_params(merged)
+            if err:
+                return {"question": item["question"], "error": {"message": err}}
+            return answer_with_backoff(item["question"], params, user, limiter, merged.get("cache", True))
+        except Exception as e:
+            logger.error(f"Error answering {item['question']!r}: {e}")
+            return {"question": item["question"], "error": {"message": str(e)}}
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        results = list(executor.map(run, items))
+    if SEMANTIC_CACHE_ENABLED:
+        semantic_cache.save()
+    return results
+
+
+def lambda_handler(event, context):
+    user = event.get("user_id", "anonymous")
+    if "questions" in event:
+        questions = event["questions"]
+        if not isinstance(questions, list) or len(questions) > MAX_BATCH_SIZE:
+            return {
+                'statusCode': 400,
+                'body': {"error": {"message": f"questions must be a list of at most {MAX_BATCH_SIZE} items"}}
+            }
+        defaults = {key: value for key, value in event.items() if key not in ("questions", "question")}
+        return {
+            'statusCode': 200,
+            'body': {"results": answer_batch(questions, defaults, user)}
+        }
+
+    query = event["question"]
+    err, params = validate_retrieval_params(event)
+    if err:
+        print(f"Invalid request: {err}")
+        return {
+            'statusCode': 400,
+            'body': {"error": {"message": err}}
+        }
 
     return {
         'statusCode': 200,
-        'body': {"question": query.strip(), "answer": generated_text.strip()}
+        'body': answer(query, params, user, cache=event.get("cache", True))
     }
+
+
+# JSONL in, JSONL out batch runner for the nightly FAQ refresh, e.g.
+#   KNOWLEDGE_BASE_ID=... python bedrock-kb.py questions.jsonl answers.jsonl --concurrency 8
+# every input line is a question string or an object accepted by the batch mode
+if __name__ == "__main__":
+    import sys
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions against the knowledge base.")
+    parser.add_argument("input", help="JSONL file with one question per line, - for stdin")
+    parser.add_argument("output", help="JSONL file to write one result per line, - for stdout")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--chunk-size", type=int, default=MAX_BATCH_SIZE, help="questions held in memory at once")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+    # (line number, question or None, error of a line that did not parse)
+    chunk = []
+
+    def flush():
+        answers = iter(answer_batch([item for _, item, error in chunk if error is None], {}, "batch-cli", args.concurrency))
+        for line_number, _, error in chunk:
+            result = next(answers) if error is None else {"line": line_number, "error": {"message": error}}
+            sink.write(json.dumps(result) + "\n")
+        sink.flush()
+        chunk.clear()
+
+    for line_number, line in enumerate(source, 1):
+        if line.strip():
+            try:
+                chunk.append((line_number, json.loads(line), None))
+            except json.JSONDecodeError as e:
+                chunk.append((line_number, None, f"invalid JSON: {e}"))
+        if len(chunk) >= args.chunk_size:
+            flush()
+    if chunk:
+        flush()
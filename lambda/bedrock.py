@@ -1,14 +1,49 @@
 
 
+import os
 import json
 import boto3
 import logging
+from botocore.config import Config
+from botocore.exceptions import ClientError, BotoCoreError
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from bedrock_metrics import emit_metrics, usage_from_invoke_model, Stopwatch
+from circuit_breaker import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded
 
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
+# longest a single inference may take, the invocation's remaining time lowers it further
+READ_TIMEOUT_SECONDS = int(os.environ.get("BEDROCK_READ_TIMEOUT_SECONDS", "60"))
+
 # Let's use Amazon S3
-bedrock_runtime = boto3.client('bedrock-runtime')
+bedrock_runtime = boto3.client('bedrock-runtime', config=Config(
+    connect_timeout=2,
+    read_timeout=READ_TIMEOUT_SECONDS,
+    retries={'max_attempts': 2, 'mode': 'standard'}
+))
+# runs the call so the handler can stop waiting at the deadline
+invoke_executor = ThreadPoolExecutor(max_workers=4)
+
+# errors that mean bedrock is unhealthy or overloaded, not that the request was wrong
+UNAVAILABLE_CODES = {"ThrottlingException", "ServiceUnavailableException", "ModelTimeoutException",
+                     "InternalServerException", "ModelNotReadyException"}
+
+
+def bedrock_failure(e):
+    if isinstance(e, ClientError):
+        return e.response['Error']['Code'] in UNAVAILABLE_CODES
+    return isinstance(e, (BotoCoreError, DeadlineExceeded))
+
+
+# one breaker per model, a throttled model says nothing about the others
+breakers = {}
+
+
+def get_breaker(model_id):
+    if model_id not in breakers:
+        breakers[model_id] = CircuitBreaker(f"bedrock:{model_id}", is_failure=bedrock_failure)
+    return breakers[model_id]
 
 def response_payload(err, res=None):
     if err:
@@ -36,11 +71,40 @@ def lambda_handler(event, context):
         
     http_method = event['httpMethod']
     if http_method == 'POST':
-        return get_message(event,user)
+        return get_message(event, user, Deadline(context))
     else:
         logger.error(f"Unsupported HTTP method: {http_method}")
         return response_payload("Method Not Allowed", None)
 
+def unavailable_response(error):
+    """
+    Fallback when the model is failing or the invocation is out of time.
+    """
+    return {
+        "statusCode": 503,
+        "body": json.dumps({"error": {"message": f"The assistant is temporarily unavailable, please try again shortly. ({error})"}}),
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+            "Retry-After": str(int(getattr(error, "retry_after", 10)))
+        },
+    }
+
+def invoke_model_within(deadline, body, model_id, accept, content_type):
+    """
+    invoke_model behind the model's circuit breaker, given up on once the deadline is reached.
+    """
+    timeout = deadline.timeout(READ_TIMEOUT_SECONDS)
+
+    def bounded():
+        future = invoke_executor.submit(invoke_model, body, model_id, accept, content_type)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise DeadlineExceeded(f"{model_id} did not answer within {timeout:.1f}s")
+
+    return get_breaker(model_id).call(bounded)
+
 def invoke_model(body, model_id, accept, content_type):
     """
     Invokes Amazon bedrock model to run an inference
@@ -69,7 +133,7 @@ def invoke_model(body, model_id, accept, content_type):
 
 # note, increase timeout lambda to long time in order to work (15 minutes)
 # https://docs.aws.amazon.com/bedrock/latest/userguide/model-parameters-anthropic-claude-messages.html
-def get_message(event, user):
+def get_message(event, user, deadline):
     # Extract the request body from the event
     body = json.loads(event["body"])
     messages = body["messages"]
@@ -89,11 +153,18 @@ def get_message(event, user):
     accept = "application/json"
     contentType = "application/json"
     try:
-        response = invoke_model(body, modelId, accept, contentType)
+        with Stopwatch() as sw:
+            response = invoke_model_within(deadline, body, modelId, accept, contentType)
         print(response)
         response_body = json.loads(response.get("body").read())
         print(response_body.get("content"))
+        metrics = usage_from_invoke_model(response, response_body)
+        metrics["InvocationLatency"] = sw.elapsed_ms
+        emit_metrics("InvokeModel", modelId, user, metrics)
         return response_payload(None, response_body.get("content"))
+    except (CircuitOpen, DeadlineExceeded) as e:
+        logger.warning(f"Bedrock unavailable: {e}")
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error: {e}")
         return response_payload(f'Error get message: {e}', None)
@@ -0,0 +1,96 @@
+import json
+import time
+
+# CloudWatch Embedded Metric Format - https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+# Lambda ships every stdout line to CloudWatch Logs, so printing an EMF document is enough to create the metrics.
+NAMESPACE = "Health4Us/Bedrock"
+
+# USD per 1000 tokens, used by bedrock_usage_report.py
+# https://aws.amazon.com/bedrock/pricing/
+MODEL_PRICING = {
+    "anthropic.claude-3-haiku-20240307-v1:0": {"input": 0.00025, "output": 0.00125},
+    "anthropic.claude-3-sonnet-20240229-v1:0": {"input": 0.003, "output": 0.015},
+}
+
+METRIC_UNITS = {
+    "InputTokens": "Count",
+    "OutputTokens": "Count",
+    "ModelLatency": "Milliseconds",
+    "InvocationLatency": "Milliseconds",
+    "RetrievalLatency": "Milliseconds",
+    "RetrievedReferences": "Count",
+    "CacheHit": "Count",
+    "CacheSimilarity": "None",
+}
+
+
+def usage_from_invoke_model(response, response_body):
+    """
+    Extracts token counts and model latency from an invoke_model response.
+
+    The body carries "usage" for anthropic messages, the HTTP headers carry
+    the same counts for every model provider, so the headers are the fallback.
+    """
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    usage = response_body.get("usage", {})
+    metrics = {
+        "InputTokens": usage.get("input_tokens", headers.get("x-amzn-bedrock-input-token-count")),
+        "OutputTokens": usage.get("output_tokens", headers.get("x-amzn-bedrock-output-token-count")),
+        "ModelLatency": headers.get("x-amzn-bedrock-invocation-latency"),
+    }
+    return {name: int(value) for name, value in metrics.items() if value is not None}
+
+
+def emit_metrics(operation, model_id, user, metrics):
+    """
+    Prints one EMF document with the given metrics, dimensioned per operation and model.
+
+    The user is a plain property, not a dimension: a dimension per user would create a
+    custom metric per user. Per user numbers come from Logs Insights or bedrock_usage_report.py.
+
+    Args:
+        operation (str): the api that was called e.g. InvokeModel, RetrieveAndGenerate
+        model_id (str): the model that served the request, None when no model was called
+        user (str): cognito sub of the caller
+        metrics (dict): metric name -> value, names must be in METRIC_UNITS
+    """
+    metrics = {name: value for name, value in metrics.items() if value is not None}
+    if not metrics:
+        return
+    document = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Operation", "ModelId"]],
+                    "Metrics": [{"Name": name, "Unit": METRIC_UNITS[name]} for name in metrics],
+                }
+            ],
+        },
+        "Operation": operation,
+        # a dimension value must be a string, an EMF document with null is dropped
+        "ModelId": model_id or "none",
+        "UserId": user,
+    }
+    document.update(metrics)
+    print(json.dumps(document))
+
+
+class Stopwatch:
+    """
+    Measures wall clock time of a block in milliseconds.
+
+    with Stopwatch() as sw:
+        call()
+    sw.elapsed_ms
+    """
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.elapsed_ms = None
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed_ms = int((time.perf_counter() - self.start) * 1000)
+        return False
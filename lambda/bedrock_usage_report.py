@@ -0,0 +1,129 @@
+import sys
+import json
+import math
+import argparse
+from collections import defaultdict
+
+from bedrock_metrics import NAMESPACE, MODEL_PRICING
+
+# Offline capacity planning report over the EMF lines written by bedrock.py and bedrock-kb.py.
+# Export the log groups first, e.g.
+#   aws logs filter-log-events --log-group-name /aws/lambda/bedrock --filter-pattern '"Health4Us/Bedrock"' \
+#       --query 'events[].message' --output text > usage.log
+#   python bedrock_usage_report.py usage.log --by user
+
+PERCENTILE_METRICS = ["InvocationLatency", "ModelLatency", "RetrievalLatency", "CacheSimilarity"]
+# operations that call no model of their own, they have no cost in the report
+NON_MODEL_OPERATIONS = {"SemanticCache", "Retrieve"}
+
+
+def read_documents(lines):
+    """
+    Yields the EMF documents found in exported log lines, skipping everything else.
+    Lambda prefixes print() output with a timestamp and request id, so parse from the first brace.
+    """
+    for line in lines:
+        start = line.find("{")
+        if start == -1:
+            continue
+        try:
+            document = json.loads(line[start:])
+        except ValueError:
+            continue
+        metrics = document.get("_aws", {}).get("CloudWatchMetrics", [])
+        if any(m.get("Namespace") == NAMESPACE for m in metrics):
+            yield document
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+def cost(model_id, input_tokens, output_tokens):
+    pricing = MODEL_PRICING.get(model_id)
+    if pricing is None:
+        return None
+    return input_tokens / 1000 * pricing["input"] + output_tokens / 1000 * pricing["output"]
+
+
+def aggregate(documents, group_by):
+    groups = defaultdict(lambda: {
+        "invocations": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cost_usd": 0.0,
+        "unpriced_invocations": 0,
+        "cache_hits": 0,
+        "latencies": defaultdict(list),
+    })
+    for document in documents:
+        model_id = document.get("ModelId", "unknown")
+        if group_by == "user":
+            key = (document.get("Operation"), model_id, document.get("UserId", "unknown"))
+        else:
+            key = (document.get("Operation"), model_id)
+        group = groups[key]
+        input_tokens = document.get("InputTokens", 0)
+        output_tokens = document.get("OutputTokens", 0)
+        group["invocations"] += 1
+        group["cache_hits"] += document.get("CacheHit", 0)
+        group["input_tokens"] += input_tokens
+        group["output_tokens"] += output_tokens
+        if document.get("Operation") not in NON_MODEL_OPERATIONS:
+            # RetrieveAndGenerate reports no tokens, pricing it from zero tokens would show $0
+            has_tokens = "InputTokens" in document or "OutputTokens" in document
+            invocation_cost = cost(model_id, input_tokens, output_tokens) if has_tokens else None
+            if invocation_cost is None:
+                group["unpriced_invocations"] += 1
+            else:
+                group["cost_usd"] += invocation_cost
+        for name in PERCENTILE_METRICS:
+            if name in document:
+                group["latencies"][name].append(document[name])
+
+    report = []
+    for key, group in sorted(groups.items(), key=lambda kv: [str(k) for k in kv[0]]):
+        row = {"operation": key[0], "model_id": key[1]}
+        if group_by == "user":
+            row["user"] = key[2]
+        row.update({
+            "invocations": group["invocations"],
+            "input_tokens": group["input_tokens"],
+            "output_tokens": group["output_tokens"],
+            "cost_usd": round(group["cost_usd"], 6),
+            "unpriced_invocations": group["unpriced_invocations"],
+        })
+        if key[0] == "SemanticCache":
+            row["cache_hit_rate"] = round(group["cache_hits"] / group["invocations"], 4)
+        for name, values in group["latencies"].items():
+            values.sort()
+            row[name] = {
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": values[-1],
+            }
+        report.append(row)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate Bedrock EMF usage logs into cost and latency percentiles.")
+    parser.add_argument("files", nargs="*", help="exported log files, reads stdin when omitted")
+    parser.add_argument("--by", choices=["model", "user"], default="model", help="group per model or per model and user")
+    args = parser.parse_args(argv)
+
+    if args.files:
+        lines = (line for path in args.files for line in open(path))
+    else:
+        lines = sys.stdin
+    report = aggregate(read_documents(lines), args.by)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+import os
+import sys
+import csv
+import json
+import math
+import time
+import uuid
+import argparse
+import multiprocessing
+from collections import deque
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+from retry import DYNAMODB_THROTTLE_CODES, sleep_backoff
+
+# Offline bulk loader for the social tables, instead of calling the API once per record.
+#   python bulk_load.py posts posts.jsonl --wcu 500 --workers 4
+#   python bulk_load.py users users.csv --checkpoint users.ckpt      (rerun the same command to resume)
+#
+# The input is read one line at a time and mapped to the item shapes the Lambdas write:
+# posts.py, comments.py, like.py and users-to-db.py. Batches of 25 go to a pool of writer
+# processes, each with its own BatchWriteItem client. At most --wcu write capacity units are
+# sent per second, estimated from the item sizes (1 WCU per started KB).
+#
+# The checkpoint records the last input line whose batch and every earlier batch were
+# written. Ids the loader generates come from the file name and line number, so a batch
+# written again after a resume overwrites the same items instead of adding copies.
+
+BATCH_SIZE = 25
+MAX_ATTEMPTS = 10
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 5
+CHECKPOINT_SECONDS = 5
+REPORT_SECONDS = 10
+
+# table name, key attributes
+TABLES = {
+    "posts": ("posts", ("id",)),
+    "comments": ("comments", ("id",)),
+    "likes": ("likes", ("id", "associated_id")),
+    "users": ("users", ("id",)),
+}
+
+
+def stable_id(prefix, source, line_number, time_creation):
+    # same shape as generate_unique_*_id in the Lambdas: <prefix>_<ms>_<uuid>
+    timestamp = int(datetime.fromisoformat(time_creation).replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return f"{prefix}_{timestamp}_{uuid.uuid5(uuid.NAMESPACE_URL, f'{source}:{line_number}')}"
+
+
+def require(record, *names):
+    for name in names:
+        if not record.get(name):
+            raise ValueError(f"missing {name}")
+
+
+def map_post(record, source, line_number, default_time):
+    require(record, "text", "user")
+    time_creation = record.get("time_creation") or default_time
+    return {
+        'id': record.get("id") or stable_id("post", source, line_number, time_creation),
+        'text': record["text"],
+        'time_creation': time_creation,
+        'user': record["user"],
+    }
+
+
+def map_comment(record, source, line_number, default_time):
+    require(record, "text", "post_id", "user")
+    time_creation = record.get("time_creation") or default_time
+    return {
+        'id': record.get("id") or stable_id("comment", source, line_number, time_creation),
+        'text': record["text"],
+        'post_id': record["post_id"],
+        'time_creation': time_creation,
+        'user': record["user"],
+    }
+
+
+def map_like(record, source, line_number, default_time):
+    # like.py stores the liked post or comment as associated_id
+    associated_id = record.get("associated_id") or record.get("post_id") or record.get("comment_id")
+    if not associated_id:
+        raise ValueError("missing associated_id, post_id or comment_id")
+    require(record, "user")
+    time_creation = record.get("time_creation") or default_time
+    return {
+        'id': record.get("id") or stable_id("like", source, line_number, time_creation),
+        'associated_id': associated_id,
+        'time_creation': time_creation,
+        'user': record["user"],
+    }
+
+
+def map_user(record, source, line_number, default_time):
+    # users-to-db.py: the Cognito sub is the id, the name defaults to the email's local part
+    user_id = record.get("id") or record.get("sub")
+    if not user_id:
+        raise ValueError("missing id or sub")
+    name = record.get("name") or (record.get("email") or "").split("@")[0]
+    if not name:
+        raise ValueError("missing name or email")
+    item = {key: value for key, value in record.items() if value not in (None, "") and key not in ("sub", "email")}
+    item.update({'id': user_id, 'name': name})
+    return item
+
+
+MAPPERS = {
+    "posts": map_post,
+    "comments": map_comment,
+    "likes": map_like,
+    "users": map_user,
+}
+
+
+def read_records(path, input_format, start_after, errors):
+    """
+    Yields (line number, record) one at a time, skipping lines up to start_after.
+    CSV line numbers count the header as line 1. JSONL lines that do not parse are
+    added to errors as (line number, message) and skipped.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if input_format == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                if reader.line_num > start_after:
+                    yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(f, 1):
+                if line_number > start_after and line.strip():
+                    try:
+                        # DynamoDB does not take floats
+                        record = json.loads(line, parse_float=Decimal)
+                    except ValueError as e:
+                        errors.append((line_number, f"invalid JSON: {e}"))
+                        continue
+                    yield line_number, record
+
+
+def item_wcu(item):
+    # a write costs 1 WCU per started KB of item size
+    return max(1, math.ceil(len(json.dumps(item, default=str).encode("utf-8")) / 1024))
+
+
+class TokenBucket:
+    """
+    Allows `rate` units per second, with up to one second of burst.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self, units):
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # a batch larger than the burst waits for a full bucket and goes into debt
+            if self.tokens >= min(units, self.rate):
+                self.tokens -= units
+                return
+            time.sleep((min(units, self.rate) - self.tokens) / self.rate)
+
+
+# writer process state, set by init_writer
+writer = {}
+
+
+def init_writer(table_name, key_names, region):
+    writer["client"] = boto3.resource('dynamodb', region_name=region)
+    writer["table_name"] = table_name
+    writer["key_names"] = key_names
+
+
+def write_batch(batch):
+    """
+    Runs in a writer process.
+
+    Args:
+        batch: [(line number, item)], at most 25
+    Returns:
+        (consumed WCU, [(line number, error message)] of the items not written)
+    """
+    table_name = writer["table_name"]
+
+    def key(item):
+        return tuple(item[name] for name in writer["key_names"])
+
+    # keys are unique within a batch, see batches()
+    pending = {key(item): {"PutRequest": {"Item": item}} for _, item in batch}
+    lines = {key(item): line_number for line_number, item in batch}
+    consumed = 0
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = writer["client"].batch_write_item(
+                RequestItems={table_name: list(pending.values())},
+                ReturnConsumedCapacity="TOTAL"
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] not in DYNAMODB_THROTTLE_CODES:
+                return consumed, [(lines[item_key], str(e)) for item_key in pending]
+            unprocessed = list(pending.values())
+        else:
+            consumed += sum(c.get("CapacityUnits", 0) for c in response.get("ConsumedCapacity", []))
+            unprocessed = response.get("UnprocessedItems", {}).get(table_name, [])
+        if not unprocessed:
+            return consumed, []
+        pending = {key(request["PutRequest"]["Item"]): request for request in unprocessed}
+        sleep_backoff(attempt, BASE_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+    return consumed, [(lines[item_key], "unprocessed after retries") for item_key in pending]
+
+
+def read_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def write_checkpoint(path, checkpoint):
+    if not path:
+        return
+    # replace, so an interrupted write never leaves a truncated checkpoint
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def batches(records, kind, source, default_time, key_names, errors):
+    """
+    Maps records to items and groups them by 25. A key already in the current batch
+    starts a new one, BatchWriteItem rejects two writes of the same key in a call.
+    """
+    mapper = MAPPERS[kind]
+    batch, keys = [], set()
+    for line_number, record in records:
+        try:
+            item = mapper(record, source, line_number, default_time)
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+            continue
+        key = tuple(item[name] for name in key_names)
+        if len(batch) == BATCH_SIZE or key in keys:
+            yield batch
+            batch, keys = [], set()
+        batch.append((line_number, item))
+        keys.add(key)
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("kind", choices=sorted(MAPPERS))
+    parser.add_argument("input", help="JSONL or CSV file")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="default from the file extension")
+    parser.add_argument("--table", help="default the table the Lambdas use")
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION"))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--wcu", type=float, default=0, help="write capacity units per second, 0 for no limit")
+    parser.add_argument("--checkpoint", help="default <input>.checkpoint")
+    parser.add_argument("--errors", help="JSONL of the lines that were not loaded, default <input>.errors")
+    args = parser.parse_args()
+
+    input_format = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    table_name, key_names = TABLES[args.kind]
+    table_name = args.table or table_name
+    checkpoint_path = args.checkpoint or f"{args.input}.checkpoint"
+    errors_path = args.errors or f"{args.input}.errors"
+
+    checkpoint = read_checkpoint(checkpoint_path) or {
+        "kind": args.kind,
+        "line": 0,
+        # time_creation of records without one, kept so a resumed run generates the same ids
+        "default_time": datetime.utcnow().isoformat(),
+    }
+    if checkpoint["kind"] != args.kind:
+        parser.error(f"{checkpoint_path} belongs to a {checkpoint['kind']} load")
+    if checkpoint["line"]:
+        print(f"Resuming after line {checkpoint['line']}", file=sys.stderr)
+
+    source = os.path.basename(args.input)
+    mapping_errors = []
+    bucket = TokenBucket(args.wcu)
+    written = failed = 0
+    consumed_total = 0.0
+    started = last_report = last_checkpoint = time.monotonic()
+    # (last line of the batch, async result), oldest first, so the checkpoint only moves
+    # past a line once every earlier batch is done
+    in_flight = deque()
+    max_in_flight = args.workers * 4
+
+    with open(errors_path, "a", encoding="utf-8") as errors_file, \
+            multiprocessing.Pool(args.workers, initializer=init_writer, initargs=(table_name, key_names, args.region)) as pool:
+
+        def record_errors(errors):
+            for line_number, message in errors:
+                errors_file.write(json.dumps({"line": line_number, "error": message}) + "\n")
+
+        def complete_oldest():
+            nonlocal written, failed, consumed_total
+            last_line, size, result = in_flight.popleft()
+            consumed, errors = result.get()
+            consumed_total += consumed
+            written += size - len(errors)
+            failed += len(errors)
+            record_errors(errors)
+            checkpoint["line"] = last_line
+
+        records = read_records(args.input, input_format, checkpoint["line"], mapping_errors)
+        for batch in batches(records, args.kind, source, checkpoint["default_time"], key_names, mapping_errors):
+            failed += len(mapping_errors)
+            record_errors(mapping_errors)
+            mapping_errors.clear()
+
+            bucket.take(sum(item_wcu(item) for _, item in batch))
+            in_flight.append((batch[-1][0], len(batch), pool.apply_async(write_batch, (batch,))))
+            while len(in_flight) >= max_in_flight or (in_flight and in_flight[0][2].ready()):
+                complete_oldest()
+
+            now = time.monotonic()
+            if now - last_checkpoint >= CHECKPOINT_SECONDS:
+                errors_file.flush()
+                write_checkpoint(checkpoint_path, checkpoint)
+                last_checkpoint = now
+            if now - last_report >= REPORT_SECONDS:
+                elapsed = now - started
+                print(f"{written} written, {failed} failed, {written / elapsed:,.0f} items/s, "
+                      f"{consumed_total / elapsed:,.0f} WCU/s, line {checkpoint['line']}", file=sys.stderr)
+                last_report = now
+
+        while in_flight:
+            complete_oldest()
+        failed += len(mapping_errors)
+        record_errors(mapping_errors)
+    write_checkpoint(checkpoint_path, checkpoint)
+
+    elapsed = time.monotonic() - started
+    print(json.dumps({
+        "kind": args.kind,
+        "table": table_name,
+        "written": written,
+        "failed": failed,
+        "seconds": round(elapsed, 1),
+        "items_per_second": round(written / elapsed, 1) if elapsed else None,
+        "consumed_wcu": consumed_total,
+        "last_line": checkpoint["line"],
+        "errors": errors_path if failed else None,
+    }, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import os
+import time
+import boto3
+import logging
+import threading
+from collections import deque
+from botocore.exceptions import ClientError
+
+# Circuit breaker and per-invocation deadline for calls to external services
+# (NewsAPI in news.py and in api.py at the repository root, Bedrock in bedrock.py).
+# lambda/circuit_breaker.py and circuit_breaker.py are the same file, the two directories
+# are deployed as separate bundles.
+#
+# A breaker counts the outcomes of the calls in the last WINDOW_SECONDS. Once at least
+# MIN_CALLS were made and the failure rate reaches FAILURE_RATE it opens: calls fail
+# immediately with CircuitOpen for OPEN_SECONDS, then a single trial call is let through
+# and its outcome closes or reopens the breaker.
+#
+# The state lives in the container. With CIRCUIT_BREAKER_TABLE set, opening is also
+# written to DynamoDB (item id=<breaker name>, open_until=<epoch seconds>) and read at
+# most every SHARED_STATE_SECONDS, so other containers stop calling a failing service
+# without each having to see the failures themselves.
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+WINDOW_SECONDS = 60
+MIN_CALLS = 5
+FAILURE_RATE = 0.5
+OPEN_SECONDS = 30
+SHARED_STATE_SECONDS = 5
+# kept back from the Lambda timeout to build and return the fallback response
+RESERVE_MS = 500
+
+table_name = os.environ.get("CIRCUIT_BREAKER_TABLE")
+state_table = boto3.resource('dynamodb').Table(table_name) if table_name else None
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable, retry in {int(retry_after)}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, is_failure=None):
+        """
+        Args:
+            name: identifies the dependency, also the DynamoDB item id
+            is_failure: exception -> bool, False for errors that say nothing about the
+                dependency's health (e.g. a bad request), default every exception
+        """
+        self.name = name
+        self.is_failure = is_failure or (lambda e: True)
+        self.lock = threading.Lock()
+        # (time, failed) of recent calls
+        self.calls = deque()
+        self.open_until = 0
+        self.trial_running = False
+        self.shared_checked_at = 0
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Runs fn unless the breaker is open, raising CircuitOpen instead.
+        """
+        trial = self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._after_call(trial, failed=self.is_failure(e))
+            raise
+        self._after_call(trial, failed=False)
+        return result
+
+    def _before_call(self):
+        now = time.time()
+        self._read_shared_state(now)
+        with self.lock:
+            if now < self.open_until:
+                raise CircuitOpen(self.name, self.open_until - now)
+            if self.open_until:
+                # half open, one trial call at a time
+                if self.trial_running:
+                    raise CircuitOpen(self.name, 1)
+                self.trial_running = True
+                return True
+            return False
+
+    def _after_call(self, trial, failed):
+        now = time.time()
+        with self.lock:
+            self.calls.append((now, failed))
+            while self.calls and self.calls[0][0] < now - WINDOW_SECONDS:
+                self.calls.popleft()
+            if trial:
+                self.trial_running = False
+                if not failed:
+                    self.open_until = 0
+                    self.calls.clear()
+                    logger.info(f"Circuit {self.name} closed")
+                    self._write_shared_state(0)
+                    return
+            failures = sum(1 for _, call_failed in self.calls if call_failed)
+            should_open = trial or (len(self.calls) >= MIN_CALLS and failures / len(self.calls) >= FAILURE_RATE)
+            if not failed or not should_open:
+                return
+            self.open_until = now + OPEN_SECONDS
+            logger.warning(f"Circuit {self.name} opened, {failures} of {len(self.calls)} recent calls failed")
+            self._write_shared_state(self.open_until)
+
+    def _read_shared_state(self, now):
+        if state_table is None or now - self.shared_checked_at < SHARED_STATE_SECONDS:
+            return
+        self.shared_checked_at = now
+        try:
+            item = state_table.get_item(Key={'id': self.name}).get('Item')
+        except ClientError as e:
+            logger.error(f"Error reading circuit state: {e}")
+            return
+        open_until = int(item['open_until']) if item else 0
+        with self.lock:
+            if open_until > now and open_until > self.open_until:
+                self.open_until = open_until
+
+    def _write_shared_state(self, open_until):
+        if state_table is None:
+            return
+        try:
+            state_table.put_item(Item={'id': self.name, 'open_until': int(open_until)})
+        except ClientError as e:
+            logger.error(f"Error writing circuit state: {e}")
+
+
+class Deadline:
+    """
+    Latency ceiling of one invocation, from the Lambda context. Every call to a
+    dependency takes its timeout from here so the handler always has time to answer.
+    """
+
+    def __init__(self, context, reserve_ms=RESERVE_MS):
+        self.expires_at = None
+        if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+            self.expires_at = time.monotonic() + (context.get_remaining_time_in_millis() - reserve_ms) / 1000
+
+    def remaining(self):
+        if self.expires_at is None:
+            return float("inf")
+        return self.expires_at - time.monotonic()
+
+    def timeout(self, cap, minimum=0.1):
+        """
+        Returns min(cap, time left) in seconds, raises DeadlineExceeded below minimum.
+        """
+        remaining = self.remaining()
+        if remaining < minimum:
+            raise DeadlineExceeded(f"{remaining:.2f}s left of the invocation")
+        return min(cap, remaining)
@@ -0,0 +1,107 @@
+import os
+import json
+import boto3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+
+# Cascading cleanup after a post or comment is deleted, SQS trigger of CLEANUP_QUEUE_URL.
+# posts.py and comments.py delete the item itself and queue {"type": "post" | "comment", "id": ...};
+# this removes what hangs off it:
+#   post    -> its comments, the likes of those comments, the likes of the post
+#   comment -> the likes of the comment
+# Children are found through the indexes below, not scans. Deleting is idempotent, a
+# message that fails is redelivered and picks up whatever is left.
+#
+# comments needs a GSI on post_id, likes one on associated_id (keys only is enough).
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+dynamodb = boto3.resource('dynamodb')
+comment_table = dynamodb.Table('comments')
+like_table = dynamodb.Table('likes')
+
+COMMENTS_BY_POST_INDEX = os.environ.get("COMMENTS_BY_POST_INDEX", "post_id-index")
+LIKES_BY_ASSOCIATED_INDEX = os.environ.get("LIKES_BY_ASSOCIATED_INDEX", "associated_id-index")
+CONCURRENCY = 8
+# keys each thread deletes through its own batch_writer (25 per BatchWriteItem)
+DELETE_CHUNK_SIZE = 250
+
+
+def query_keys(table, index_name, attribute, value, key_names):
+    """
+    Returns the primary keys of every item of the index partition attribute = value.
+    """
+    keys = []
+    params = {
+        'IndexName': index_name,
+        'KeyConditionExpression': Key(attribute).eq(value),
+        'ProjectionExpression': ", ".join(f"#k{i}" for i in range(len(key_names))),
+        'ExpressionAttributeNames': {f"#k{i}": name for i, name in enumerate(key_names)},
+    }
+    while True:
+        response = table.query(**params)
+        keys.extend({name: item[name] for name in key_names} for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return keys
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def like_keys(associated_id):
+    # likes are keyed by id and associated_id, see like.py delete_like
+    return query_keys(like_table, LIKES_BY_ASSOCIATED_INDEX, 'associated_id', associated_id, ('id', 'associated_id'))
+
+
+def delete_keys(table, keys):
+    """
+    Deletes the keys in parallel chunks, batch_writer sends them 25 at a time and resends unprocessed ones.
+    """
+    def delete_chunk(chunk):
+        with table.batch_writer() as batch:
+            for key in chunk:
+                batch.delete_item(Key=key)
+        return len(chunk)
+
+    chunks = [keys[i:i + DELETE_CHUNK_SIZE] for i in range(0, len(keys), DELETE_CHUNK_SIZE)]
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        return sum(executor.map(delete_chunk, chunks))
+
+
+def cleanup_comment(comment_id):
+    deleted = delete_keys(like_table, like_keys(comment_id))
+    logger.info(f"Removed {deleted} likes of comment {comment_id}")
+    return {"likes": deleted}
+
+
+def cleanup_post(post_id):
+    comments = query_keys(comment_table, COMMENTS_BY_POST_INDEX, 'post_id', post_id, ('id',))
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        comment_likes = executor.map(like_keys, [comment['id'] for comment in comments])
+        likes = like_keys(post_id) + [key for keys in comment_likes for key in keys]
+    # likes first, a retry after a failure still finds the comments and through them their likes
+    deleted_likes = delete_keys(like_table, likes)
+    deleted_comments = delete_keys(comment_table, comments)
+    logger.info(f"Removed {deleted_comments} comments and {deleted_likes} likes of post {post_id}")
+    return {"comments": deleted_comments, "likes": deleted_likes}
+
+
+CLEANUPS = {
+    "post": cleanup_post,
+    "comment": cleanup_comment,
+}
+
+
+def lambda_handler(event, context):
+    """
+    SQS trigger, failed messages are reported so SQS redelivers only those.
+    """
+    failures = []
+    for record in event['Records']:
+        try:
+            message = json.loads(record['body'])
+            CLEANUPS[message['type']](message['id'])
+        except Exception as e:
+            logger.error(f"Error cleaning up after {record['body']}: {e}")
+            failures.append({"itemIdentifier": record['messageId']})
+    return {"batchItemFailures": failures}
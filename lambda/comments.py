@@ -1,3 +1,4 @@
+import os
 import json
 import uuid
 import time
@@ -7,14 +8,19 @@ import logging
 from datetime import datetime
 from boto3.dynamodb.conditions import Attr
 from boto3.dynamodb.conditions import Key
+from projection import parse_fields, projection_params
+from like_counts import number_of_likes
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
+# comments and likes of deleted items are removed by cleanup.py from this queue
+CLEANUP_QUEUE_URL = os.environ.get("CLEANUP_QUEUE_URL")
+sqs = boto3.client('sqs')
+
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('comments')
 user_table = dynamodb.Table('users')
-like_table = dynamodb.Table('likes')
 
 def generate_unique_comment_id():
     timestamp = int(time.time() * 1000)  # Current time in milliseconds
@@ -43,6 +49,34 @@ def check_authorization(comment_id, user):
         
     logger.info("Done checking user authorization")
         
+# added to every comment by get_comment and list_comments, not attributes of the comments table
+COMPUTED_FIELDS = ('user_detail', 'number_likes')
+
+
+def add_comment_details(comment, fields):
+    """
+    Adds user_detail and number_likes, only those requested when fields is given.
+    """
+    if fields is None or fields.wants('user_detail'):
+        user_id = comment.get('user')
+        if user_id:
+            children = fields.children('user_detail') if fields else None
+            user_response = user_table.get_item(
+                Key={'id': user_id},
+                **(projection_params(children) if children else {})
+            )
+            if 'Item' in user_response:
+                comment['user_detail'] = user_response['Item']
+            else:
+                comment['user_detail'] = None
+
+    if fields is None or fields.wants('number_likes'):
+        comment_id = comment.get('id')
+        comment['number_likes'] = number_of_likes(comment_id)
+
+    return fields.trim(comment) if fields else comment
+
+
 def lambda_handler(event, context):
     logger.info(f"Received event: {event}")
     user = "test"
@@ -52,10 +86,14 @@ def lambda_handler(event, context):
     if http_method == 'POST':
         return create_comment(event,user)
     elif http_method == 'GET':
+        try:
+            fields = parse_fields(event.get('queryStringParameters'))
+        except ValueError as e:
+            return response_payload(e, None)
         if 'pathParameters' in event and event['pathParameters'] is not None and 'id' in event['pathParameters']:
-            return get_comment(event)
+            return get_comment(event, fields)
         else:
-            return list_comments(event)
+            return list_comments(event, fields)
     elif http_method == 'PUT':
         return update_comment(event,user)
     elif http_method == 'DELETE':
@@ -100,37 +138,19 @@ def create_comment(event,user):
     logger.info("Done Creating a new comment")
 
 
-def get_comment(event):
+def get_comment(event, fields=None):
     logger.info("Getting a comment")
     comment_id = event['pathParameters']['id']
     
     try:
-        response = table.get_item(Key={'id': comment_id})
+        response = table.get_item(
+            Key={'id': comment_id},
+            # the details need the comment's id and user even when they are not returned
+            **(fields.projection(required=('id', 'user'), computed=COMPUTED_FIELDS) if fields else {})
+        )
         if 'Item' in response:
             logger.info(f"comment found with ID: {comment_id}")
-            comment = response['Item']
-            user_id = comment.get('user')
-            if user_id:
-                user_response = user_table.get_item(Key={'id': user_id})
-                if 'Item' in user_response:
-                    comment['user_detail'] = user_response['Item']
-                else:
-                    comment['user_detail'] = None
-            comment_id = comment.get('id')
-            existing_like = None
-            existing_like = like_table.scan(
-                FilterExpression=(
-                    Attr('associated_id').eq(comment_id)
-                )
-            )
-            
-            if existing_like and existing_like.get('Items'):
-                # return the number of likes
-                num_likes = len(existing_like['Items'])
-                comment['number_likes'] = num_likes
-            else:
-                comment['number_likes'] = 0
-                
+            comment = add_comment_details(response['Item'], fields)
             return response_payload(None, comment)
         else:
             logger.info(f"comment not found with ID: {comment_id}")
@@ -141,7 +161,7 @@ def get_comment(event):
     logger.info("Done getting a comment")
 
 
-def list_comments(event):
+def list_comments(event, fields=None):
     logger.info("Listing all comments")
     # Extract post_id from query parameters
     if event.get('queryStringParameters') is not None:
@@ -158,33 +178,12 @@ def list_comments(event):
 
     try:
         response = table.scan(
-            FilterExpression=Attr('post_id').eq(post_id)
+            FilterExpression=Attr('post_id').eq(post_id),
+            **(fields.projection(required=('id', 'user'), computed=COMPUTED_FIELDS) if fields else {})
         )
         comments = response.get('Items', [])
         
-        for comment in comments:
-            user_id = comment.get('user')
-            if user_id:
-                user_response = user_table.get_item(Key={'id': user_id})
-                if 'Item' in user_response:
-                    comment['user_detail'] = user_response['Item']
-                else:
-                    comment['user_detail'] = None
-            comment_id = comment.get('id')
-            existing_like = None
-            existing_like = like_table.scan(
-                FilterExpression=(
-                    Attr('associated_id').eq(comment_id)
-                )
-            )
-            
-            if existing_like and existing_like.get('Items'):
-                # return the number of likes
-                num_likes = len(existing_like['Items'])
-                comment['number_likes'] = num_likes
-            else:
-                comment['number_likes'] = 0
-        
+        comments = [add_comment_details(comment, fields) for comment in comments]
         
         logger.info(f"Found {len(response['Items'])} comments")
         return response_payload(None, comments)
@@ -231,6 +230,17 @@ def update_comment(event,user):
     logger.info("Done updating a comment")
 
 
+def queue_cleanup(item_type, item_id):
+    if not CLEANUP_QUEUE_URL:
+        logger.warning(f"CLEANUP_QUEUE_URL not set, children of {item_type} {item_id} are kept")
+        return
+    try:
+        sqs.send_message(QueueUrl=CLEANUP_QUEUE_URL, MessageBody=json.dumps({"type": item_type, "id": item_id}))
+    except ClientError as e:
+        # the comment itself is gone, leftovers are only wasted space
+        logger.error(f"Error queueing cleanup of {item_type} {item_id}: {e}")
+
+
 def delete_comment(event,user):
     logger.info("Deleting a comment")
     comment_id = event['pathParameters']['id']
@@ -242,6 +252,7 @@ def delete_comment(event,user):
     try:
         table.delete_item(Key={'id': comment_id})
         logger.info(f"comment deleted successfully with ID: {comment_id}")
+        queue_cleanup('comment', comment_id)
         return response_payload(None, 'comment deleted successfully')
     except Exception as e:
         logger.error(f"Error deleting comment: {e}")
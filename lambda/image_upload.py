@@ -0,0 +1,185 @@
+import os
+import boto3
+import hashlib
+import binascii
+import logging
+from botocore.exceptions import ClientError
+
+# Uploads a base64 encoded image to S3 without materializing the whole decoded image.
+# The encoded string is decoded a slice at a time into a buffer of one multipart part,
+# so peak memory is the encoded request body plus one part instead of body + full image.
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+# images whose decoded size is below this go up with one put_object
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+# S3 needs parts of at least 5 MB except the last
+PART_SIZE = 8 * 1024 * 1024
+# encoded characters decoded per step, a multiple of 4 keeps slices aligned to base64 quanta
+DECODE_CHARS = 1024 * 1024
+
+WHITESPACE = (" ", "\n", "\r", "\t")
+
+# content hash -> stored key, so a re-uploaded image resolves to the object (and cached analysis) it already has
+IMAGE_HASH_TABLE = os.environ.get("IMAGE_HASH_TABLE", "image_hashes")
+hash_table = None
+
+
+def strip_data_url(data):
+    """
+    Returns the offset of the base64 payload, skipping a data:image/...;base64, prefix.
+    """
+    if data.startswith("data:"):
+        return data.index(",") + 1
+    return 0
+
+
+def decoded_size(data, offset=0):
+    # exact unless the payload contains whitespace, only used to pick the upload path
+    padding = data[-2:].count("=")
+    return (len(data) - offset) * 3 // 4 - padding
+
+
+def iter_decoded(data, offset=0, decode_chars=DECODE_CHARS):
+    """
+    Yields the decoded bytes of data[offset:] in slices of roughly decode_chars * 3/4 bytes.
+    """
+    carry = ""
+    position = offset
+    while position < len(data):
+        piece = data[position:position + decode_chars]
+        position += decode_chars
+        if carry:
+            piece = carry + piece
+        if any(c in piece for c in WHITESPACE):
+            piece = "".join(piece.split())
+        # decode whole 4 character groups, keep the rest for the next slice
+        cut = len(piece) // 4 * 4
+        carry = piece[cut:]
+        if cut:
+            yield binascii.a2b_base64(piece[:cut])
+    if carry:
+        raise binascii.Error("Incorrect base64 padding")
+
+
+def upload_base64_image(s3, bucket, key, data, content_type='image/jpeg'):
+    """
+    Decodes base64 image data and uploads it to s3://bucket/key.
+
+    Args:
+        s3: boto3 S3 client
+        data (str): base64 image, optionally as a data url
+    Returns:
+        size of the uploaded image in bytes
+    """
+    offset = strip_data_url(data)
+    if decoded_size(data, offset) < MULTIPART_THRESHOLD:
+        body = b"".join(iter_decoded(data, offset))
+        s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+        return len(body)
+
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)['UploadId']
+    parts = []
+    size = 0
+    buffer = bytearray()
+    try:
+        for decoded in iter_decoded(data, offset):
+            buffer += decoded
+            size += len(decoded)
+            while len(buffer) >= PART_SIZE:
+                with memoryview(buffer) as view:
+                    part = bytes(view[:PART_SIZE])
+                del buffer[:PART_SIZE]
+                parts.append(upload_part(s3, bucket, key, upload_id, len(parts) + 1, part))
+        if buffer or not parts:
+            parts.append(upload_part(s3, bucket, key, upload_id, len(parts) + 1, bytes(buffer)))
+        s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        logger.info(f"Uploaded {key} in {len(parts)} parts, {size} bytes")
+        return size
+    except Exception:
+        # incomplete uploads are billed until aborted
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+def upload_part(s3, bucket, key, upload_id, part_number, body):
+    response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body)
+    return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+
+def get_hash_table():
+    global hash_table
+    if hash_table is None:
+        hash_table = boto3.resource('dynamodb').Table(IMAGE_HASH_TABLE)
+    return hash_table
+
+
+def find_duplicate(s3, bucket, scope, digest):
+    """
+    Returns the key already stored for this content in the scope, None if there is none
+    or the object has since been deleted.
+    """
+    item = get_hash_table().get_item(Key={'id': f"{scope}#{digest}"}).get('Item')
+    if not item:
+        return None
+    try:
+        s3.head_object(Bucket=bucket, Key=item['image_key'])
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return item['image_key']
+
+
+def remember_hash(scope, digest, key):
+    try:
+        get_hash_table().put_item(
+            Item={'id': f"{scope}#{digest}", 'image_key': key},
+            # a concurrent upload of the same content may have won, keep its key
+            ConditionExpression="attribute_not_exists(id)"
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.error(f"Error saving image hash: {e}")
+
+
+def upload_base64_image_dedup(s3, bucket, scope, key, data, content_type='image/jpeg'):
+    """
+    Like upload_base64_image, but content already uploaded in the same scope is not stored again.
+
+    Args:
+        scope (str): dedup namespace, e.g. "profile_images/<user id>", images are
+            never shared across users
+    Returns:
+        (key, duplicate) where key is the existing object's key when duplicate is True
+    """
+    offset = strip_data_url(data)
+    if decoded_size(data, offset) < MULTIPART_THRESHOLD:
+        body = b"".join(iter_decoded(data, offset))
+        digest = hashlib.sha256(body).hexdigest()
+        existing = find_duplicate(s3, bucket, scope, digest)
+        if existing:
+            logger.info(f"Duplicate upload, reusing {existing}")
+            return existing, True
+        s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+        remember_hash(scope, digest, key)
+        return key, False
+
+    # large images are decoded twice, once to hash and once to upload, to keep memory bounded
+    sha256 = hashlib.sha256()
+    for decoded in iter_decoded(data, offset):
+        sha256.update(decoded)
+    digest = sha256.hexdigest()
+    existing = find_duplicate(s3, bucket, scope, digest)
+    if existing:
+        logger.info(f"Duplicate upload, reusing {existing}")
+        return existing, True
+    upload_base64_image(s3, bucket, key, data, content_type)
+    remember_hash(scope, digest, key)
+    return key, False
@@ -0,0 +1,78 @@
+import os
+import json
+import time
+import base64
+import argparse
+import tracemalloc
+
+import image_upload
+
+# Extra memory and latency of the base64 image upload paths.
+#   python image_upload_benchmark.py --sizes 1 5 10 25 50
+# Memory is the peak allocated on top of the already parsed request body, which is
+# what the upload path adds to the function's RSS. S3 calls go to a client that
+# discards the bytes, so this measures decode and buffering only, not network time.
+
+
+class DiscardingS3:
+    def put_object(self, Body, **kwargs):
+        return {}
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "benchmark"}
+
+    def upload_part(self, Body, PartNumber, **kwargs):
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        return {}
+
+    def abort_multipart_upload(self, **kwargs):
+        return {}
+
+
+def decode_upload(s3, data):
+    # the previous implementation
+    image = base64.b64decode(data)
+    s3.put_object(Bucket="bench", Key="bench.jpg", Body=image, ContentType="image/jpeg")
+
+
+def streaming_upload(s3, data):
+    image_upload.upload_base64_image(s3, "bench", "bench.jpg", data)
+
+
+MODES = {"decode": decode_upload, "streaming": streaming_upload}
+
+
+def measure(size_mb, mode):
+    data = base64.b64encode(os.urandom(size_mb * 1024 * 1024)).decode("ascii")
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    MODES[mode](DiscardingS3(), data)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"size_mb": size_mb, "mode": mode, "latency_ms": round(elapsed_ms, 1),
+            "extra_peak_mb": round((peak - baseline) / 1024 / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark base64 image upload memory and latency.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10, 25, 50], help="image sizes in MB")
+    parser.add_argument("--json", action="store_true", help="print one json line per measurement")
+    args = parser.parse_args()
+
+    if not args.json:
+        print(f"{'size':>6} {'mode':>9} {'latency ms':>11} {'extra peak MB':>14}")
+    for size_mb in args.sizes:
+        for mode in MODES:
+            result = measure(size_mb, mode)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{size_mb:>4}MB {mode:>9} {result['latency_ms']:>11} {result['extra_peak_mb']:>14}")
+
+
+if __name__ == "__main__":
+    main()
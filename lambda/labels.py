@@ -0,0 +1,110 @@
+import json
+import base64
+import boto3
+from botocore.exceptions import ClientError
+import logging
+import os
+from boto3.dynamodb.conditions import Key
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+# label -> images index written by label_index.py from the S3 upload pipeline,
+# sort key is "<confidence 000.00>#<bucket>/<key>"
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(os.environ.get('LABEL_INDEX_TABLE', 'image_labels'))
+
+# partition of the per-image bookkeeping items, same as label_index.IMAGE_ITEM_PREFIX
+IMAGE_ITEM_PREFIX = "__image__#"
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def lambda_handler(event, context):
+    logger.info(f"Received event: {event}")
+    http_method = event['httpMethod']
+    if http_method == 'GET':
+        return search_label(event)
+    else:
+        logger.error(f"Unsupported HTTP method: {http_method}")
+        return response_payload("Method Not Allowed", None)
+
+
+def encode_token(last_evaluated_key):
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode("utf-8")).decode("ascii")
+
+
+def decode_token(token):
+    return json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+
+
+def search_label(event):
+    logger.info("Searching images by label")
+    query_string_parameters = event.get('queryStringParameters') or {}
+
+    label = query_string_parameters.get('label', None)
+    if not label:
+        error_message = "label must be provided"
+        logger.error(error_message)
+        return response_payload(error_message, None)
+    if label.strip().lower().startswith(IMAGE_ITEM_PREFIX):
+        return response_payload('Invalid label', None)
+
+    try:
+        min_confidence = float(query_string_parameters.get('min_confidence', 0))
+        limit = min(int(query_string_parameters.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        next_token = query_string_parameters.get('next_token')
+        start_key = decode_token(next_token) if next_token else None
+    except ValueError as e:
+        return response_payload(f'Invalid query parameters: {e}', None)
+    if not 0 <= min_confidence <= 100 or limit < 1:
+        return response_payload('min_confidence must be 0-100 and limit positive', None)
+
+    params = {
+        # "~" sorts after every digit, so this covers every sort key at or above the threshold
+        'KeyConditionExpression': Key('label').eq(label.strip().lower()) & Key('sk').between(f"{min_confidence:06.2f}", "~"),
+        # most confident first
+        'ScanIndexForward': False,
+        'Limit': limit,
+        'ProjectionExpression': 'image_key, bucket, confidence',
+    }
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+
+    try:
+        response = table.query(**params)
+        images = [{
+            "image_key": item['image_key'],
+            "image_url": f"https://{item['bucket']}.s3.amazonaws.com/{item['image_key']}",
+            "confidence": float(item['confidence']),
+        } for item in response.get('Items', [])]
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        logger.info(f"Found {len(images)} images with label {label}")
+        return response_payload(None, {
+            "label": label,
+            "images": images,
+            "next_token": encode_token(last_evaluated_key) if last_evaluated_key else None,
+        })
+    except ClientError as e:
+        logger.error(f"Error searching label: {e}")
+        return response_payload(f'Error searching label: {e}', None)
+
+
+def response_payload(err, res=None):
+    if err:
+        error_message = str(err)
+        status_code = 502
+        response_body = {"error": {"message": error_message}}
+    else:
+        status_code = 200
+        response_body = res
+
+    return {
+        "statusCode": status_code,
+        "body": json.dumps(response_body),
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+    }
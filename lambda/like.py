@@ -1,3 +1,4 @@
+import os
 import json
 import uuid
 import time
@@ -7,6 +8,8 @@ import logging
 from datetime import datetime
 from boto3.dynamodb.conditions import Attr
 from boto3.dynamodb.conditions import Key
+from projection import parse_fields
+from like_counts import number_of_likes
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel("INFO")
@@ -14,6 +17,25 @@ logger.setLevel("INFO")
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('likes')
 
+# like and unlike events, counted per post or comment by like_counter.py
+LIKE_EVENTS_QUEUE_URL = os.environ.get("LIKE_EVENTS_QUEUE_URL")
+sqs = boto3.client('sqs')
+
+def queue_like_event(like_id, associated_id, delta):
+    """
+    like_counter.py counts each like id at most once and uncounts it at most once.
+    """
+    if not LIKE_EVENTS_QUEUE_URL:
+        return
+    try:
+        sqs.send_message(
+            QueueUrl=LIKE_EVENTS_QUEUE_URL,
+            MessageBody=json.dumps({"like_id": like_id, "associated_id": associated_id, "delta": delta})
+        )
+    except ClientError as e:
+        # the like itself is stored, only the counter misses it
+        logger.error(f"Error queueing like event of {like_id}: {e}")
+
 def generate_unique_like_id():
     timestamp = int(time.time() * 1000)  # Current time in milliseconds
     random_uuid = uuid.uuid4()  # Generate a random UUID
@@ -66,10 +88,15 @@ def lambda_handler(event, context):
         
 def list_likes(event,user):
     logger.info("Listing all user likes")
+    try:
+        fields = parse_fields(event.get('queryStringParameters'))
+    except ValueError as e:
+        return response_payload(e, None)
     
     try:
         response = table.scan(
-            FilterExpression=Attr('user').eq(user)
+            FilterExpression=Attr('user').eq(user),
+            **(fields.projection() if fields else {})
         )
         logger.info(f"Found {len(response['Items'])} likes for user {user}")
         return response_payload(None, response['Items'])
@@ -95,20 +122,7 @@ def count_likes(event):
         logger.error(error_message)
         return response_payload(error_message, None)
     
-    existing_like = None
-    existing_like = table.scan(
-        FilterExpression=(
-            Attr('associated_id').eq(associated_id)
-        )
-    )
-    
-    if existing_like and existing_like.get('Items'):
-        # return the number of likes
-        num_likes = len(existing_like['Items'])
-        return response_payload(None, {"likes": num_likes})
-    else:
-        # return 0 likes
-        return response_payload(None, {"likes": 0})
+    return response_payload(None, {"likes": number_of_likes(associated_id)})
 
     logger.info("Done fetching the number of likes")
 
@@ -161,6 +175,7 @@ def create_like(event,user):
         'time_creation': time_creation,
         'user': user, })
         logger.info(f"like created successfully with ID: {id}")
+        queue_like_event(id, post_or_comment_associated_id, 1)
         return response_payload(None, 'like created successfully')
     except Exception as e:
         logger.error(f"Error creating like: {e}")
@@ -222,6 +237,8 @@ def delete_like(event,user):
                 }
             )
             logger.info(f"like deleted successfully.")
+            # two concurrent unlikes of the same like count once
+            queue_like_event(partition_key_value, post_or_comment_associated_id, -1)
             return response_payload(None, 'like deleted successfully')
         except Exception as e:
             logger.error(f"Error delete like: {e}")
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import boto3
+import logging
+from collections import defaultdict
+from botocore.exceptions import ClientError
+from retry import DYNAMODB_THROTTLE_CODES, sleep_backoff
+
+# Write-behind like counters, SQS trigger of LIKE_EVENTS_QUEUE_URL.
+# like.py queues {"like_id", "associated_id", "delta": 1 | -1} for every like and unlike;
+# this folds a batch of events into one ADD per liked post or comment, so a viral post
+# costs one counter write per batch instead of one per like.
+#
+# Table LIKE_COUNTS_TABLE, partition key "id":
+#   counters: id=<associated_id>,  likes=<count>, seed_started_at, seeded_at=<epoch seconds>
+#   likes:    id="like#<like id>", state="counted" | "removed", expires_at=<TTL attribute, removed only>
+# A counter is the number of its like items in state "counted". The counter update and
+# the state changes it includes are written in one transaction:
+#   like    puts "counted",    +1, if the item does not exist
+#   unlike  "counted" -> "removed", -1; when there is no item yet the like was never
+#           counted, a "removed" tombstone is put instead, so its like event, arriving
+#           later, out of order or from the seed, is not counted either
+# A redelivered event fails its condition and is dropped, every like is counted at most
+# once and uncounted at most once.
+#
+# The first event of a post or comment seeds its counter: every like id in the likes table
+# (a query of the associated_id index, the one cleanup.py uses) is applied as a like
+# event. A like the seed sees and whose event also arrives is counted once, whatever the
+# order, so seeding needs no clock. Readers in like_counts.py only trust counters once
+# seeded_at is set, a seed that failed half way is run again, it is idempotent.
+#
+# Configure the trigger with a batch size above 10 and a batching window for bigger batches.
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+client = boto3.client('dynamodb')
+COUNTS_TABLE = os.environ.get("LIKE_COUNTS_TABLE", "like_counts")
+LIKES_TABLE = "likes"
+LIKES_BY_ASSOCIATED_INDEX = os.environ.get("LIKES_BY_ASSOCIATED_INDEX", "associated_id-index")
+
+LIKE_PREFIX = "like#"
+COUNTED = "counted"
+REMOVED = "removed"
+# longer than the queue's maximum retention, a removed like must outlive every redelivery
+REMOVED_TTL_SECONDS = 15 * 86400
+# delta of a tombstone, an unlike of a like that was not counted
+TOMBSTONE = 0
+# a transaction holds at most 100 actions, one is the counter update
+MAX_EVENTS_PER_TRANSACTION = 99
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 2
+# another consumer is writing the same counter or the table is throttling
+RETRY_REASONS = {"TransactionConflict", "ThrottlingError", "ProvisionedThroughputExceeded"}
+
+
+def like_action(like_id, delta, expires_at):
+    key = {'id': {'S': f"{LIKE_PREFIX}{like_id}"}}
+    if delta == 1:
+        return {'Put': {
+            'TableName': COUNTS_TABLE,
+            'Item': dict(key, state={'S': COUNTED}),
+            'ConditionExpression': "attribute_not_exists(id)",
+        }}
+    if delta == TOMBSTONE:
+        return {'Put': {
+            'TableName': COUNTS_TABLE,
+            'Item': dict(key, state={'S': REMOVED}, expires_at={'N': str(expires_at)}),
+            'ConditionExpression': "attribute_not_exists(id)",
+        }}
+    return {'Update': {
+        'TableName': COUNTS_TABLE,
+        'Key': key,
+        'UpdateExpression': "SET #state = :removed, expires_at = :expires_at",
+        'ConditionExpression': "#state = :counted",
+        'ExpressionAttributeNames': {'#state': "state"},
+        'ExpressionAttributeValues': {
+            ':removed': {'S': REMOVED},
+            ':counted': {'S': COUNTED},
+            ':expires_at': {'N': str(expires_at)},
+        },
+        # tells a like that was never counted from one that was already removed
+        'ReturnValuesOnConditionCheckFailure': "ALL_OLD",
+    }}
+
+
+def transaction_items(associated_id, events, expires_at):
+    items = [{
+        'Update': {
+            'TableName': COUNTS_TABLE,
+            'Key': {'id': {'S': associated_id}},
+            'UpdateExpression': "ADD likes :net",
+            'ExpressionAttributeValues': {':net': {'N': str(sum(delta for delta in events.values()))}},
+        }
+    }]
+    items.extend(like_action(like_id, delta, expires_at) for like_id, delta in events.items())
+    return items
+
+
+def apply_events(associated_id, events):
+    """
+    Adds the net delta of events that were not applied yet.
+
+    Args:
+        events: {like id: delta}, at most MAX_EVENTS_PER_TRANSACTION, one event per like
+    Returns:
+        the net delta applied
+    """
+    events = dict(events)
+    for attempt in range(MAX_ATTEMPTS):
+        if not events:
+            return 0
+        try:
+            client.transact_write_items(TransactItems=transaction_items(
+                associated_id, events, int(time.time()) + REMOVED_TTL_SECONDS))
+            return sum(events.values())
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in DYNAMODB_THROTTLE_CODES and attempt < MAX_ATTEMPTS - 1:
+                sleep_backoff(attempt, BASE_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+                continue
+            if code != 'TransactionCanceledException':
+                raise
+            # one reason per action, in order, the first is the counter update
+            reasons = e.response.get('CancellationReasons', [])
+            failed = [(like_id, reason) for like_id, reason in zip(list(events), reasons[1:])
+                      if reason.get('Code') == 'ConditionalCheckFailed']
+            if failed:
+                for like_id, reason in failed:
+                    if events[like_id] == -1 and 'Item' not in reason:
+                        # unlike of a like that was never counted
+                        events[like_id] = TOMBSTONE
+                    else:
+                        del events[like_id]
+                logger.info(f"Skipping {len(failed)} applied or uncounted like events of {associated_id}")
+                # the transaction is retried right away without them
+                continue
+            if not RETRY_REASONS.intersection(reason.get('Code') for reason in reasons) or attempt == MAX_ATTEMPTS - 1:
+                raise
+        sleep_backoff(attempt, BASE_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+    raise RuntimeError(f"Could not apply like events of {associated_id} after {MAX_ATTEMPTS} attempts")
+
+
+def apply_all(associated_id, events):
+    like_ids = list(events)
+    net = 0
+    for i in range(0, len(like_ids), MAX_EVENTS_PER_TRANSACTION):
+        net += apply_events(associated_id, {like_id: events[like_id] for like_id in like_ids[i:i + MAX_EVENTS_PER_TRANSACTION]})
+    return net
+
+
+def existing_like_ids(associated_id):
+    params = {
+        'TableName': LIKES_TABLE,
+        'IndexName': LIKES_BY_ASSOCIATED_INDEX,
+        'KeyConditionExpression': "associated_id = :id",
+        'ExpressionAttributeValues': {':id': {'S': associated_id}},
+        'ProjectionExpression': "id",
+    }
+    like_ids = []
+    while True:
+        response = client.query(**params)
+        like_ids.extend(item['id']['S'] for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return like_ids
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def seed_counter(associated_id):
+    """
+    Counts the likes already in the likes table, once per counter.
+    """
+    counter = client.get_item(TableName=COUNTS_TABLE, Key={'id': {'S': associated_id}}, ConsistentRead=True).get('Item')
+    if counter and 'seeded_at' in counter:
+        return
+    try:
+        # a counter from before seeding existed has no like items behind it, it starts over
+        client.update_item(
+            TableName=COUNTS_TABLE,
+            Key={'id': {'S': associated_id}},
+            UpdateExpression="SET likes = :zero, seed_started_at = :now",
+            ConditionExpression="attribute_not_exists(seed_started_at)",
+            ExpressionAttributeValues={':zero': {'N': "0"}, ':now': {'N': str(int(time.time()))}}
+        )
+    except ClientError as e:
+        # another consumer started seeding, applying the same likes again is a no-op
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    net = apply_all(associated_id, {like_id: 1 for like_id in existing_like_ids(associated_id)})
+    client.update_item(
+        TableName=COUNTS_TABLE,
+        Key={'id': {'S': associated_id}},
+        UpdateExpression="SET seeded_at = :now",
+        ExpressionAttributeValues={':now': {'N': str(int(time.time()))}}
+    )
+    logger.info(f"Seeded like counter of {associated_id} with {net:+d}")
+
+
+def lambda_handler(event, context):
+    """
+    SQS trigger, the messages of a target whose update failed are reported so SQS redelivers only those.
+    """
+    # associated_id -> {like id: {deltas}}, the same event twice in a batch counts once
+    targets = defaultdict(lambda: defaultdict(set))
+    messages = defaultdict(list)
+    failures = []
+    for record in event['Records']:
+        try:
+            message = json.loads(record['body'])
+            delta = int(message['delta'])
+            if delta not in (1, -1):
+                raise ValueError(f"delta must be 1 or -1, got {delta}")
+            targets[message['associated_id']][message['like_id']].add(delta)
+            messages[message['associated_id']].append(record['messageId'])
+        except (ValueError, KeyError) as e:
+            # malformed, redelivering would not help
+            logger.error(f"Dropping like event {record['body']}: {e}")
+
+    for associated_id, likes in targets.items():
+        try:
+            seed_counter(associated_id)
+            # a transaction can't touch an item twice, a like and its unlike in one batch
+            # go in separate rounds, likes first
+            net = apply_all(associated_id, {like_id: 1 for like_id, deltas in likes.items() if 1 in deltas})
+            net += apply_all(associated_id, {like_id: -1 for like_id, deltas in likes.items() if -1 in deltas})
+            logger.info(f"Applied like events of {len(likes)} likes to {associated_id}, net {net:+d}")
+        except Exception as e:
+            # events already applied changed their like items and are skipped on redelivery
+            logger.error(f"Error applying like events to {associated_id}: {e}")
+            failures.extend({"itemIdentifier": message_id} for message_id in messages[associated_id])
+    return {"batchItemFailures": failures}
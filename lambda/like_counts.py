@@ -0,0 +1,45 @@
+import os
+import boto3
+import logging
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Attr
+
+# Number of likes of a post or comment, for like.py, posts.py and comments.py.
+# With LIKE_EVENTS_QUEUE_URL set the counters of like_counter.py are read. A counter is
+# only trusted once like_counter.py has seeded it with the likes from before counting
+# started (seeded_at), until then, or without counters, the likes table is scanned.
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+dynamodb = boto3.resource('dynamodb')
+like_table = dynamodb.Table('likes')
+counts_table = dynamodb.Table(os.environ.get("LIKE_COUNTS_TABLE", "like_counts"))
+COUNTERS_ENABLED = bool(os.environ.get("LIKE_EVENTS_QUEUE_URL"))
+
+
+def read_counter(associated_id):
+    """
+    Returns the seeded count, None when there is none to trust.
+    """
+    if not COUNTERS_ENABLED:
+        return None
+    try:
+        counter = counts_table.get_item(Key={'id': associated_id}).get('Item')
+    except ClientError as e:
+        logger.error(f"Error reading like counter of {associated_id}, counting likes: {e}")
+        return None
+    if counter and 'seeded_at' in counter:
+        return int(counter.get('likes', 0))
+    return None
+
+
+def number_of_likes(associated_id):
+    likes = read_counter(associated_id)
+    if likes is not None:
+        return likes
+    existing_like = like_table.scan(
+        FilterExpression=Attr('associated_id').eq(associated_id),
+        ProjectionExpression='id'
+    )
+    return len(existing_like.get('Items', []))
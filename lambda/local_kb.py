@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import uuid
+import zlib
+import logging
+from functools import lru_cache
+
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+# Offline stand-in for the Bedrock knowledge base used by bedrock-kb.py.
+# LocalAgentRuntimeClient answers retrieve and retrieve_and_generate with the same
+# request and response shapes as the bedrock-agent-runtime client, so bedrock-kb.py
+# switches to it with KB_BACKEND=local and nothing else changes.
+
+LOCAL_KB_DIR = os.environ.get("LOCAL_KB_DIR", "/tmp/local-kb")
+CHUNK_WORDS = 200
+CHUNK_OVERLAP_WORDS = 40
+# rows scored per matrix-vector product, bounds memory while searching the memmap
+SEARCH_BLOCK_ROWS = 65536
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """
+    Dependency free embedder using signed feature hashing of lowercased words.
+
+    Good enough to exercise and benchmark retrieval offline; it matches on shared
+    words, not meaning. crc32 is used instead of hash() so vectors stay the same
+    across processes.
+    """
+
+    def __init__(self, dimensions=384):
+        self.dimensions = dimensions
+
+    @lru_cache(maxsize=200000)
+    def _bucket(self, token):
+        h = zlib.crc32(token.encode("utf-8"))
+        return h % self.dimensions, 1.0 if h & 0x80000000 else -1.0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                index, sign = self._bucket(token)
+                vectors[row, index] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """
+    Local neural embedder, needs the sentence-transformers package.
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        return self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+    "sentence-transformers": SentenceTransformerEmbedder,
+}
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap_words=CHUNK_OVERLAP_WORDS):
+    """
+    Splits text into overlapping windows of words.
+    """
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+class LocalVectorStore:
+    """
+    Chunks stored as rows of a float32 matrix on disk plus a JSONL file of chunk text.
+
+    The matrix is appended to while ingesting and memory-mapped while searching,
+    so the store can be larger than the memory given to the process.
+    """
+
+    def __init__(self, directory=LOCAL_KB_DIR, embedder=None):
+        self.directory = directory
+        self.embedder = embedder or HashingEmbedder()
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.chunks_path = os.path.join(directory, "chunks.jsonl")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self._matrix = None
+        self._chunks = None
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta["dimensions"] != self.embedder.dimensions:
+                raise ValueError(f"store has {meta['dimensions']} dimensions, embedder has {self.embedder.dimensions}")
+            self.count = meta["count"]
+        else:
+            self.count = 0
+
+    def ingest(self, documents, batch_size=512):
+        """
+        Chunks, embeds and appends documents.
+
+        Args:
+            documents: iterable of (source uri, text)
+            batch_size: chunks embedded per call to the embedder
+        Returns:
+            number of chunks added
+        """
+        added = 0
+        batch = []
+        with open(self.vectors_path, "ab") as vectors_file, open(self.chunks_path, "a") as chunks_file:
+            for source, text in documents:
+                for chunk in chunk_text(text):
+                    batch.append({"source": source, "text": chunk})
+                    if len(batch) >= batch_size:
+                        added += self._write_batch(batch, vectors_file, chunks_file)
+                        batch = []
+            if batch:
+                added += self._write_batch(batch, vectors_file, chunks_file)
+        with open(self.meta_path, "w") as f:
+            json.dump({"dimensions": self.embedder.dimensions, "count": self.count}, f)
+        self._matrix = None
+        self._chunks = None
+        return added
+
+    def _write_batch(self, batch, vectors_file, chunks_file):
+        vectors = self.embedder.embed([chunk["text"] for chunk in batch])
+        vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        for chunk in batch:
+            chunks_file.write(json.dumps(chunk) + "\n")
+        self.count += len(batch)
+        return len(batch)
+
+    def matrix(self):
+        if self._matrix is None and self.count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                     shape=(self.count, self.embedder.dimensions))
+        return self._matrix
+
+    def chunks(self):
+        if self._chunks is None:
+            # nothing ingested yet, not cached so a later ingest is picked up
+            if not os.path.exists(self.chunks_path):
+                return []
+            with open(self.chunks_path) as f:
+                self._chunks = [json.loads(line) for line in f]
+        return self._chunks
+
+    def search(self, query, k=5):
+        """
+        Returns the k chunks most similar to the query as (row, score), best first.
+        """
+        matrix = self.matrix()
+        if matrix is None:
+            return []
+        vector = self.embedder.embed([query])[0]
+        k = min(k, self.count)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            scores = matrix[start:start + SEARCH_BLOCK_ROWS] @ vector
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_rows) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order]
+
+
+class LocalAgentRuntimeClient:
+    """
+    The subset of the bedrock-agent-runtime client used by bedrock-kb.py.
+
+    Generation is extractive: the answer is the best passage, which keeps the
+    backend deterministic for tests and benchmarks of the retrieval settings.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def _retrieval_results(self, text, retrievalConfiguration=None):
+        vector_config = (retrievalConfiguration or {}).get("vectorSearchConfiguration", {})
+        k = vector_config.get("numberOfResults", 5)
+        chunks = self.store.chunks()
+        results = []
+        for row, score in self.store.search(text, k):
+            results.append({
+                "content": {"text": chunks[row]["text"]},
+                "location": {"type": "LOCAL", "localLocation": {"uri": chunks[row]["source"]}},
+                "score": score,
+            })
+        return results
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration=None, **kwargs):
+        return {"retrievalResults": self._retrieval_results(retrievalQuery["text"], retrievalConfiguration)}
+
+    def retrieve_and_generate(self, input, retrieveAndGenerateConfiguration, sessionId=None, **kwargs):
+        kb_config = retrieveAndGenerateConfiguration["knowledgeBaseConfiguration"]
+        results = self._retrieval_results(input["text"], kb_config.get("retrievalConfiguration"))
+        text = results[0]["content"]["text"] if results else "Sorry, I am unable to find an answer to that question."
+        return {
+            "sessionId": sessionId or str(uuid.uuid4()),
+            "output": {"text": text},
+            "citations": [{
+                "generatedResponsePart": {"textResponsePart": {"text": text}},
+                "retrievedReferences": [
+                    {"content": result["content"], "location": result["location"]} for result in results
+                ],
+            }],
+        }
+
+
+def read_documents(paths):
+    """
+    Yields (path, text) for every .txt and .md file under the given paths.
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names if name.endswith((".txt", ".md"))
+            )
+        for file_path in files:
+            with open(file_path, encoding="utf-8", errors="replace") as f:
+                yield file_path, f.read()
+
+
+# Build a local store from a folder of documents, e.g.
+#   python local_kb.py ingest ./docs --dir /tmp/local-kb
+#   python local_kb.py query "what causes ringworm" --dir /tmp/local-kb -k 5
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local vector store for the knowledge base handler.")
+    parser.add_argument("command", choices=["ingest", "query"])
+    parser.add_argument("args", nargs="+", help="paths to ingest, or the query text")
+    parser.add_argument("--dir", default=LOCAL_KB_DIR)
+    parser.add_argument("--embedder", choices=sorted(EMBEDDERS), default="hashing")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    store = LocalVectorStore(args.dir, EMBEDDERS[args.embedder]())
+    if args.command == "ingest":
+        print(f"Ingested {store.ingest(read_documents(args.args))} chunks, store has {store.count}")
+    else:
+        chunks = store.chunks()
+        for row, score in store.search(" ".join(args.args), args.k):
+            print(f"{score:.4f} {chunks[row]['source']}: {chunks[row]['text'][:120]}")
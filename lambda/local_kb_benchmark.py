@@ -0,0 +1,68 @@
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from local_kb import LocalVectorStore, EMBEDDERS, CHUNK_WORDS, CHUNK_OVERLAP_WORDS
+
+# Ingestion throughput and query latency of the local vector store.
+#   python local_kb_benchmark.py --chunks 100000 --k 5 10 25
+# Documents are synthetic, drawn from a fixed vocabulary, so runs are comparable.
+
+VOCABULARY_SIZE = 20000
+
+
+def synthetic_documents(chunks, seed):
+    """
+    Yields documents sized so the chunker produces exactly `chunks` chunks.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(VOCABULARY_SIZE)]
+    step = CHUNK_WORDS - CHUNK_OVERLAP_WORDS
+    # one document of `per_document` chunks is CHUNK_WORDS + (per_document - 1) * step words
+    per_document = 10
+    for i in range(0, chunks, per_document):
+        n = min(per_document, chunks - i)
+        words = rng.choices(vocabulary, k=CHUNK_WORDS + (n - 1) * step)
+        yield f"synthetic://{i // per_document}", " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local vector store.")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 25])
+    parser.add_argument("--embedder", choices=sorted(EMBEDDERS), default="hashing")
+    parser.add_argument("--dir", help="store directory, a temporary one is used and removed when omitted")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="local-kb-bench-")
+    try:
+        store = LocalVectorStore(directory, EMBEDDERS[args.embedder]())
+        start = time.perf_counter()
+        added = store.ingest(synthetic_documents(args.chunks, args.seed))
+        elapsed = time.perf_counter() - start
+        print(f"ingest: {added} chunks in {elapsed:.2f}s, {added / elapsed:.0f} chunks/s")
+
+        rng = random.Random(args.seed + 1)
+        chunks = store.chunks()
+        queries = [" ".join(rng.choice(chunks)["text"].split()[:12]) for _ in range(args.queries)]
+        for k in args.k:
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                store.search(query, k)
+                latencies.append((time.perf_counter() - start) * 1000)
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            print(f"query k={k}: p50 {p50:.2f}ms p90 {p90:.2f}ms p99 {p99:.2f}ms over {store.count} chunks")
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import time
+import boto3
+import logging
+from botocore.exceptions import ClientError
+
+# Status and start/stop of the custom labels model, shared by rekognition_check.py,
+# rekognition_analyze.py and the scheduled controller below.
+#
+# analyze records when requests arrive, the controller runs every minute from an
+# EventBridge schedule and starts the model while there is traffic and stops it once
+# nothing has asked for it during IDLE_WINDOW_SECONDS.
+
+client = boto3.client('rekognition')
+dynamodb = boto3.resource('dynamodb')
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+PROJECT_ARN = os.environ.get("PROJECT_ARN")
+VERSION_NAME = os.environ.get("VERSION_NAME")
+state_table = dynamodb.Table(os.environ.get("MODEL_STATE_TABLE", "rekognition_model_state"))
+
+STATUS_TTL_SECONDS = int(os.environ.get("MODEL_STATUS_TTL_SECONDS", "30"))
+IDLE_WINDOW_SECONDS = int(os.environ.get("MODEL_IDLE_WINDOW_SECONDS", "1800"))
+MIN_INFERENCE_UNITS = int(os.environ.get("MIN_INFERENCE_UNITS", "1"))
+# rekognition scales between min and max inference units while the model is running
+MAX_INFERENCE_UNITS = int(os.environ.get("MAX_INFERENCE_UNITS", "2"))
+# at most one last_request_at write per container in this interval, keeps the state item from running hot
+RECORD_INTERVAL_SECONDS = 30
+# a cached STARTABLE status younger than this is trusted, the model was just seen stopped
+REFRESH_FLOOR_SECONDS = int(os.environ.get("MODEL_STATUS_REFRESH_FLOOR_SECONDS", "10"))
+
+STARTABLE = ("STOPPED", "TRAINING_COMPLETED", "FAILED")
+RUNNING = "RUNNING"
+
+status_cache = {"value": None, "checked_at": 0}
+last_recorded = {"at": 0}
+
+
+def describe_model():
+    describe_response = client.describe_project_versions(ProjectArn=PROJECT_ARN, VersionNames=[VERSION_NAME])
+    for model in describe_response['ProjectVersionDescriptions']:
+        return {
+            "Status": model['Status'],
+            "StatusMessage": model.get('StatusMessage'),
+            "ProjectVersionArn": model['ProjectVersionArn'],
+        }
+    raise ValueError(f"Model version {VERSION_NAME} not found in {PROJECT_ARN}")
+
+
+def get_model_status(force=False):
+    """
+    Returns the model description, at most STATUS_TTL_SECONDS old unless force is set.
+    """
+    now = time.time()
+    if force or status_cache["value"] is None or now - status_cache["checked_at"] > STATUS_TTL_SECONDS:
+        status_cache["value"] = describe_model()
+        status_cache["checked_at"] = now
+    return status_cache["value"]
+
+
+def record_request():
+    """
+    Marks the model as wanted, called by every analyze request.
+    """
+    now = int(time.time())
+    if now - last_recorded["at"] < RECORD_INTERVAL_SECONDS:
+        return
+    last_recorded["at"] = now
+    try:
+        state_table.update_item(
+            Key={'id': VERSION_NAME},
+            UpdateExpression="SET last_request_at = :now",
+            ExpressionAttributeValues={":now": now}
+        )
+    except ClientError as e:
+        logger.error(f"Error recording model request: {e}")
+
+
+def start_model(model):
+    logger.info(f"Starting model {model['ProjectVersionArn']}")
+    try:
+        client.start_project_version(
+            ProjectVersionArn=model['ProjectVersionArn'],
+            MinInferenceUnits=MIN_INFERENCE_UNITS,
+            MaxInferenceUnits=MAX_INFERENCE_UNITS
+        )
+    except client.exceptions.ResourceInUseException:
+        # another container or the controller is already starting it
+        logger.info("Model is already starting")
+    status_cache["value"] = dict(model, Status="STARTING")
+    status_cache["checked_at"] = time.time()
+
+
+def ensure_started():
+    """
+    Starts the model if it is stopped.
+
+    Returns:
+        True when the model is running and can serve requests now
+    """
+    model = get_model_status()
+    if model["Status"] not in STARTABLE:
+        # RUNNING, or STARTING / STOPPING until the TTL runs out, no describe per request
+        return model["Status"] == RUNNING
+    # the cached status may be stale, check before starting, at most once per floor
+    if time.time() - status_cache["checked_at"] > REFRESH_FLOOR_SECONDS:
+        model = get_model_status(force=True)
+        if model["Status"] == RUNNING:
+            return True
+    if model["Status"] in STARTABLE:
+        start_model(model)
+    return False
+
+
+def lambda_handler(event, context):
+    """
+    Scheduled controller, starts the model while there is traffic and stops it after the idle window.
+    """
+    model = get_model_status(force=True)
+    item = state_table.get_item(Key={'id': VERSION_NAME}).get('Item', {})
+    last_request_at = int(item.get('last_request_at', 0))
+    idle_seconds = int(time.time()) - last_request_at
+    logger.info(f"Model {model['Status']}, idle for {idle_seconds}s")
+
+    action = "none"
+    if idle_seconds < IDLE_WINDOW_SECONDS:
+        if model["Status"] in STARTABLE:
+            start_model(model)
+            action = "start"
+    elif model["Status"] == RUNNING:
+        logger.info(f"Stopping model {model['ProjectVersionArn']}")
+        client.stop_project_version(ProjectVersionArn=model['ProjectVersionArn'])
+        action = "stop"
+
+    state_table.update_item(
+        Key={'id': VERSION_NAME},
+        UpdateExpression="SET #status = :status, checked_at = :now",
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={":status": model["Status"], ":now": int(time.time())}
+    )
+    return {"status": model["Status"], "idle_seconds": idle_seconds, "action": action}
@@ -4,6 +4,9 @@ import boto3
 from botocore.exceptions import ClientError
 import logging
 import base64
+from image_upload import upload_base64_image_dedup
+from projection import parse_fields
+from variant_keys import with_image_variant, variant_urls
 
 # Set up logging
 logger = logging.getLogger()
@@ -25,7 +28,12 @@ def lambda_handler(event, context):
     
     http_method = event['httpMethod']
     if http_method == 'GET':
-        return get_user(user)
+        query_string_parameters = event.get('queryStringParameters') or {}
+        try:
+            fields = parse_fields(query_string_parameters)
+        except ValueError as e:
+            return response_payload(e, None)
+        return get_user(user, query_string_parameters.get('variant', 'feed'), fields)
     elif http_method == 'PUT':
         data = json.loads(event['body'])
         return update_user(user,data)
@@ -33,13 +41,19 @@ def lambda_handler(event, context):
         logger.error(f"Unsupported HTTP method: {http_method}")
         return response_payload("Method Not Allowed", None)
 
-def get_user(user):
+def get_user(user, variant='feed', fields=None):
     logger.info("Getting a user")
+    params = {}
+    if fields:
+        # with_image_variant reads both to pick the image URL
+        image_fields = ('profile_image_url', 'profile_image_variants') if fields.wants('profile_image_url') or fields.wants('profile_image_original_url') else ()
+        params = fields.projection(required=image_fields, computed=('profile_image_original_url',))
     try:
-        response = table.get_item(Key={'id': user})
+        response = table.get_item(Key={'id': user}, **params)
         if 'Item' in response:
             logger.info(f"User found with ID: {user}")
-            return response_payload(None, response['Item'])
+            item = with_image_variant(response['Item'], variant)
+            return response_payload(None, fields.trim(item) if fields else item)
         else:
             logger.info(f"User not found with ID: {user}")
             return response_payload('User not found', None)
@@ -53,8 +67,11 @@ def update_user(user,data):
     # Check if there is an image to upload
     image_data = data.pop("profile_image", None)
     if image_data:
-        image_url = upload_image_to_s3(user, image_data)
-        data["profile_image_url"] = image_url
+        image_key, duplicate = upload_image_to_s3(user, image_data)
+        data["profile_image_url"] = f"https://{BUCKET_NAME}.s3.amazonaws.com/{image_key}"
+        # variants of the previous image no longer apply, lambda-handle-sqs.py sets the
+        # new ones once the upload lands; a duplicate already has them
+        data["profile_image_variants"] = variant_urls(BUCKET_NAME, image_key) if duplicate else None
 
     update_expression = "SET "
     expression_attribute_values = {}
@@ -84,17 +101,14 @@ def update_user(user,data):
 
 def upload_image_to_s3(user_id, image_data):
     try:
-        image_decoded = base64.b64decode(image_data)
         image_key = f"profile_images/{user_id}/{uuid.uuid4()}.jpg"
-        s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=image_key,
-            Body=image_decoded,
-            ContentType='image/jpeg'
-        )
+        # decoded a slice at a time, large images go up as a multipart upload
+        # an image the user already uploaded resolves to the stored copy
+        image_key, duplicate = upload_base64_image_dedup(
+            s3, BUCKET_NAME, f"profile_images/{user_id}", image_key, image_data, 'image/jpeg')
         image_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{image_key}"
         logger.info(f"Image uploaded successfully to {image_url}")
-        return image_url
+        return image_key, duplicate
     except Exception as e:
         logger.error(f"Error uploading image: {e}")
         raise e
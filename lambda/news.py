@@ -1,13 +1,286 @@
 import os
+import time
+import base64
+import hashlib
 import requests
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor, wait
+from news_cache import NewsCache, session, TIMEOUT
+from circuit_breaker import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded
 
 # Initialize the logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
-def get_news(event):
+# per country headlines, shared by the container and across containers through DynamoDB
+news_cache = NewsCache()
+
+
+def newsapi_failure(e):
+    # 4xx other than rate limiting is our request, not NewsAPI being down
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return True
+
+
+newsapi_breaker = CircuitBreaker("newsapi", is_failure=newsapi_failure)
+
+URL = "https://newsapi.org/v2/top-headlines"
+# snapshots the scheduled refresh keeps warm, run it more often than NEWS_CACHE_TTL_SECONDS
+COUNTRIES = os.environ.get("NEWS_COUNTRIES", "us").split(",")
+CATEGORIES = os.environ.get("NEWS_CATEGORIES", "health").split(",")
+REFRESH_CONCURRENCY = 8
+
+# ?categories=health,science&sources=bbc-news merges several feeds into one response,
+# articles have the NewsAPI fields unless ?fields= picks some
+AGGREGATE_FIELDS = ("source", "author", "title", "description", "url", "urlToImage", "publishedAt", "content")
+NEWS_CATEGORIES = {"business", "entertainment", "general", "health", "science", "sports", "technology"}
+MAX_FEEDS = 10
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100
+# every feed of an aggregate request shares this budget, late feeds are left out
+AGGREGATE_DEADLINE_SECONDS = float(os.environ.get("NEWS_AGGREGATE_DEADLINE_SECONDS", "4"))
+# not used as a context manager, shutting down would wait for the feeds past the deadline
+aggregate_executor = ThreadPoolExecutor(max_workers=MAX_FEEDS)
+
+
+def cache_key(country, category):
+    return f"top-headlines:{country}:{category}"
+
+
+def source_cache_key(source):
+    return f"top-headlines:sources:{source}"
+
+
+def compact(data):
+    """
+    Serializes the NewsAPI payload once, when the snapshot is made, in the shape
+    NewsAPI returns it, without whitespace.
+    """
+    return json.dumps(data, separators=(",", ":"))
+
+
+def fetch_headlines(news_api_key, country, category, deadline=None):
+    return fetch_top_headlines({
+        "apiKey": news_api_key,
+        "country": country,
+        "category": category
+    }, deadline)
+
+
+def fetch_source(news_api_key, source, deadline=None):
+    # NewsAPI does not allow sources together with country or category
+    return fetch_top_headlines({
+        "apiKey": news_api_key,
+        "sources": source
+    }, deadline)
+
+
+def fetch_top_headlines(params, deadline=None):
+    timeout = TIMEOUT
+    if deadline is not None:
+        left = deadline.timeout(sum(TIMEOUT))
+        timeout = (min(TIMEOUT[0], left), min(TIMEOUT[1], left))
+
+    def get():
+        response = session.get(URL, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    return compact(newsapi_breaker.call(get).json())
+
+
+def refresh_snapshots():
+    """
+    Scheduled entry point, fetches every configured country and category concurrently
+    and stores them so the GET path is a single cache read.
+    """
+    news_api_key = os.getenv("NEWS_API_KEY")
+    pairs = [(country.strip(), category.strip()) for country in COUNTRIES for category in CATEGORIES]
+
+    def refresh(pair):
+        country, category = pair
+        try:
+            news_cache.put(cache_key(country, category), fetch_headlines(news_api_key, country, category))
+            return None
+        except (requests.exceptions.RequestException, CircuitOpen) as e:
+            logger.error(f"Error refreshing {country}/{category}: {e}")
+            return f"{country}/{category}"
+
+    with ThreadPoolExecutor(max_workers=REFRESH_CONCURRENCY) as executor:
+        failed = [pair for pair in executor.map(refresh, pairs) if pair]
+    logger.info(f"Refreshed {len(pairs) - len(failed)} of {len(pairs)} snapshots")
+    return {"refreshed": len(pairs) - len(failed), "failed": failed}
+
+
+def fallback_response(key, event, error):
+    """
+    NewsAPI is failing or there is no time left: the last snapshot whatever its age,
+    or 503 when there is none.
+    """
+    entry = news_cache.peek(key)
+    if entry is not None:
+        logger.warning(f"Serving {key} from {int(entry.age())}s ago: {error}")
+        response = snapshot_response(entry, event)
+        response["headers"]["Warning"] = '110 - "Response is Stale"'
+        return response
+    return {
+        "statusCode": 503,
+        "body": json.dumps({"error": f"News are temporarily unavailable: {error}"}),
+        "headers": {
+            "Content-Type": "application/json",
+            "Retry-After": str(int(getattr(error, "retry_after", 30)))
+        }
+    }
+
+
+def snapshot_response(entry, event):
+    """
+    Returns the stored snapshot as is: the gzip bytes to clients that accept them,
+    the decompressed text otherwise. The JSON is never parsed or re-encoded here.
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Cache-Control": "public, max-age=60",
+        # the body depends on Accept-Encoding, shared caches must not mix the two
+        "Vary": "Accept-Encoding",
+        "Age": str(int(entry.age()))
+    }
+    request_headers = {key.lower(): value for key, value in (event.get("headers") or {}).items()}
+    if "gzip" in request_headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return {
+            "statusCode": 200,
+            "isBase64Encoded": True,
+            "body": base64.b64encode(entry.compressed).decode("ascii"),
+            "headers": headers
+        }
+    return {
+        "statusCode": 200,
+        "body": entry.body,
+        "headers": headers
+    }
+
+def split_param(value):
+    return [item.strip().lower() for item in (value or "").split(",") if item.strip()]
+
+
+def article_ids(article):
+    """
+    Dedupe keys: the URL without query string and trailing slash, and a hash of the
+    normalized title, for outlets syndicating the same story under different URLs.
+    """
+    url = (article.get("url") or "").split("?", 1)[0].rstrip("/").lower()
+    title = " ".join((article.get("title") or "").lower().split())
+    ids = set()
+    if url:
+        ids.add(f"url:{url}")
+    if title:
+        ids.add(f"title:{hashlib.sha1(title.encode('utf-8')).hexdigest()}")
+    return ids
+
+
+def merge_articles(feeds, fields, limit):
+    """
+    Merges the article lists, drops duplicates by URL or title and returns the newest first.
+    """
+    seen = set()
+    merged = []
+    for articles in feeds:
+        for article in articles:
+            ids = article_ids(article)
+            if ids & seen:
+                continue
+            seen.update(ids)
+            merged.append(article)
+    # ISO 8601 timestamps sort chronologically as strings
+    merged.sort(key=lambda article: article.get("publishedAt") or "", reverse=True)
+    return [{field: article.get(field) for field in fields} for article in merged[:limit]]
+
+
+def aggregate_news(event, news_api_key, deadline):
+    """
+    Fetches several categories and sources concurrently within AGGREGATE_DEADLINE_SECONDS,
+    or what is left of the invocation, and returns one merged, deduplicated, newest first list.
+    """
+    query_string_parameters = event.get("queryStringParameters") or {}
+    country = query_string_parameters.get("country", "us")
+    categories = split_param(query_string_parameters.get("categories"))
+    sources = split_param(query_string_parameters.get("sources"))
+    fields = split_param(query_string_parameters.get("fields")) or list(AGGREGATE_FIELDS)
+    try:
+        limit = min(int(query_string_parameters.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        limit = 0
+
+    invalid = [category for category in categories if category not in NEWS_CATEGORIES]
+    # fields are compared lower case, map them back to the stored names
+    field_names = {field.lower(): field for field in AGGREGATE_FIELDS}
+    unknown_fields = [field for field in fields if field not in field_names]
+    if invalid or unknown_fields or limit < 1 or len(categories) + len(sources) > MAX_FEEDS:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": f"categories must be among {sorted(NEWS_CATEGORIES)}, "
+                                         f"fields among {list(AGGREGATE_FIELDS)}, limit positive "
+                                         f"and at most {MAX_FEEDS} categories and sources in total"})
+        }
+    fields = [field_names[field] for field in fields]
+
+    feeds = {}
+    for category in categories:
+        feeds[f"category:{category}"] = (cache_key(country, category),
+                                         lambda category=category: fetch_headlines(news_api_key, country, category, deadline))
+    for source in sources:
+        feeds[f"source:{source}"] = (source_cache_key(source),
+                                     lambda source=source: fetch_source(news_api_key, source, deadline))
+
+    started = time.monotonic()
+    futures = {
+        aggregate_executor.submit(news_cache.get, key, loader): name
+        for name, (key, loader) in feeds.items()
+    }
+    done, not_done = wait(futures, timeout=max(0, min(AGGREGATE_DEADLINE_SECONDS, deadline.remaining())))
+
+    articles = []
+    missing = [futures[future] for future in not_done]
+    oldest_age = 0
+    # request order, so which copy of a duplicate is kept does not depend on timing
+    for future in [future for future in futures if future in done]:
+        try:
+            entry = future.result()
+        except (requests.exceptions.RequestException, CircuitOpen, DeadlineExceeded) as e:
+            logger.error(f"Error fetching {futures[future]}: {e}")
+            missing.append(futures[future])
+            continue
+        oldest_age = max(oldest_age, entry.age())
+        articles.append(json.loads(entry.body)["articles"])
+    logger.info(f"Aggregated {len(done)} of {len(futures)} feeds in {time.monotonic() - started:.2f}s")
+
+    if not articles and missing:
+        return {
+            "statusCode": 502,
+            "body": json.dumps({"error": f"No feed answered: {sorted(missing)}"})
+        }
+    merged = merge_articles(articles, fields, limit)
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "status": "ok",
+            "totalResults": len(merged),
+            "articles": merged,
+            # feeds that failed or missed the deadline, the rest of the response is still valid
+            "missing": sorted(missing),
+        }, separators=(",", ":")),
+        "headers": {
+            "Content-Type": "application/json",
+            "Cache-Control": "public, max-age=60",
+            "Age": str(int(oldest_age))
+        }
+    }
+
+
+def get_news(event, deadline):
     """
     Fetches the top health headlines from the NewsAPI and returns the results.
     """
@@ -21,28 +294,24 @@ def get_news(event):
             "body": json.dumps({"error": "NewsAPI key not found in environment variables."})
         }
     
+    query_string_parameters = event.get("queryStringParameters") or {}
+    if "categories" in query_string_parameters or "sources" in query_string_parameters:
+        return aggregate_news(event, news_api_key, deadline)
+
     country = "us"
     # Uncomment this if you want to support country parameter from query string
     if "queryStringParameters" in event and "country" in event["queryStringParameters"]:
         country = event["queryStringParameters"]["country"]
 
-    # Set the API endpoint and parameters
-    url = "https://newsapi.org/v2/top-headlines"
-    params = {
-        "apiKey": news_api_key,
-        "country": country,
-        "category": "health"
-    }
+    category = "health"
 
-    # Make the API request
+    # Make the API request, unless the snapshot is fresh or a stale one can be served
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return {
-            "statusCode": 200,
-            "body": json.dumps(data)
-        }
+        entry = news_cache.get(cache_key(country, category),
+                               lambda: fetch_headlines(news_api_key, country, category, deadline))
+        return snapshot_response(entry, event)
+    except (CircuitOpen, DeadlineExceeded) as e:
+        return fallback_response(cache_key(country, category), event, e)
     except requests.exceptions.RequestException as e:
         logger.error(f"RequestException: {e}")
         return {
@@ -52,11 +321,15 @@ def get_news(event):
 
 def lambda_handler(event, context):
     logger.info("Received event: %s", json.dumps(event))
+
+    # EventBridge schedule
+    if event.get("source") == "aws.events":
+        return refresh_snapshots()
     
     try:
         http_method = event["httpMethod"]
         if http_method == "GET":
-            return get_news(event)
+            return get_news(event, Deadline(context))
         else:
             logger.error(f"Unsupported HTTP method: {http_method}")
             return {
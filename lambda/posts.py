@@ -1,3 +1,4 @@
+import os
 import json
 import uuid
 import time
@@ -7,14 +8,20 @@ import logging
 from datetime import datetime
 from boto3.dynamodb.conditions import Attr
 from boto3.dynamodb.conditions import Key
+from projection import parse_fields, projection_params
+from like_counts import number_of_likes
+from variant_keys import with_image_variant
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
+# comments and likes of deleted items are removed by cleanup.py from this queue
+CLEANUP_QUEUE_URL = os.environ.get("CLEANUP_QUEUE_URL")
+sqs = boto3.client('sqs')
+
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('posts')
 user_table = dynamodb.Table('users')
-like_table = dynamodb.Table('likes')
 comment_table = dynamodb.Table('comments')
 
 def generate_unique_post_id():
@@ -40,7 +47,64 @@ def check_authorization(post_id, user):
     except ClientError as e:
         logger.error(f"Error checking authorization: {e}")
         return False, f'Error checking authorization: {e}'
-        
+
+
+# added to every post by get_post and list_posts, not attributes of the posts table
+COMPUTED_FIELDS = ('user_detail', 'number_likes', 'number_comments')
+
+
+def user_detail_projection(children):
+    """
+    Projection of the users table for the requested user_detail attributes,
+    plus what with_image_variant reads to rewrite the image URL.
+    """
+    if children is None:
+        return {}
+    attributes = list(children)
+    if 'profile_image_url' in children or 'profile_image_original_url' in children:
+        attributes += ['profile_image_url', 'profile_image_variants']
+    return projection_params(list(dict.fromkeys(a for a in attributes if a != 'profile_image_original_url')))
+
+
+def add_post_details(post, fields):
+    """
+    Adds user_detail, number_likes and number_comments, only those requested when fields is given.
+    """
+    if fields is None or fields.wants('user_detail'):
+        user_id = post.get('user')
+        if user_id:
+            user_response = user_table.get_item(
+                Key={'id': user_id},
+                **user_detail_projection(fields.children('user_detail') if fields else None)
+            )
+            if 'Item' in user_response:
+                post['user_detail'] = with_image_variant(user_response['Item'], 'thumbnail')
+            else:
+                post['user_detail'] = None
+
+    post_id = post.get('id')
+    if fields is None or fields.wants('number_likes'):
+        post['number_likes'] = number_of_likes(post_id)
+
+    if fields is None or fields.wants('number_comments'):
+        existing_comments = None
+        existing_comments = comment_table.scan(
+            FilterExpression=(
+                Attr('post_id').eq(post_id)
+            ),
+            ProjectionExpression='id'
+        )
+
+        if existing_comments and existing_comments.get('Items'):
+            # return the number of likes
+            num_comments = len(existing_comments['Items'])
+            post['number_comments'] = num_comments
+        else:
+            post['number_comments'] = 0
+
+    return fields.trim(post) if fields else post
+
+
 def lambda_handler(event, context):
     logger.info(f"Received event: {event}")
     user = "test"
@@ -51,10 +115,14 @@ def lambda_handler(event, context):
     if http_method == 'POST':
         return create_post(event,user)
     elif http_method == 'GET':
+        try:
+            fields = parse_fields(event.get('queryStringParameters'))
+        except ValueError as e:
+            return response_payload(e, None)
         if 'pathParameters' in event and event['pathParameters'] is not None and 'id' in event['pathParameters']:
-            return get_post(event)
+            return get_post(event, fields)
         else:
-            return list_posts()
+            return list_posts(fields)
     elif http_method == 'PUT':
         return update_post(event,user)
     elif http_method == 'DELETE':
@@ -100,53 +168,19 @@ def create_post(event,user):
 #         logger.error(f"Error getting post: {e}")
 #         return response_payload(f'Error getting post: {e}', None)
 
-def get_post(event):
+def get_post(event, fields=None):
     logger.info("Getting a post")
     post_id = event['pathParameters']['id']
     
     try:
-        response = table.get_item(Key={'id': post_id})
+        response = table.get_item(
+            Key={'id': post_id},
+            # the details need the post's id and user even when they are not returned
+            **(fields.projection(required=('id', 'user'), computed=COMPUTED_FIELDS) if fields else {})
+        )
         if 'Item' in response:
             logger.info(f"Post found with ID: {post_id}")
-            post = response['Item']
-            user_id = post.get('user')
-            
-            # Fetch user details
-            user_response = user_table.get_item(Key={'id': user_id})
-            if 'Item' in user_response:
-                post['user_detail'] = user_response['Item']
-            else:
-                post['user_detail'] = None
-                
-            post_id = post.get('id')
-            existing_like = None
-            existing_like = like_table.scan(
-                FilterExpression=(
-                    Attr('associated_id').eq(post_id)
-                )
-            )
-            
-            if existing_like and existing_like.get('Items'):
-                # return the number of likes
-                num_likes = len(existing_like['Items'])
-                post['number_likes'] = num_likes
-            else:
-                post['number_likes'] = 0
-                
-            existing_comments = None
-            existing_comments = comment_table.scan(
-                FilterExpression=(
-                    Attr('post_id').eq(post_id)
-                )
-            )
-            
-            if existing_comments and existing_comments.get('Items'):
-                # return the number of likes
-                num_comments = len(existing_comments['Items'])
-                post['number_comments'] = num_comments
-            else:
-                post['number_comments'] = 0
-            
+            post = add_post_details(response['Item'], fields)
             return response_payload(None, post)
         else:
             logger.info(f"Post not found with ID: {post_id}")
@@ -166,50 +200,17 @@ def get_post(event):
 #         logger.error(f"Error listing posts: {e}")
 #         return response_payload(f'Error listing posts: {e}', None)
 
-def list_posts():
+def list_posts(fields=None):
     logger.info("Listing all posts")
     try:
-        response = table.scan()
+        response = table.scan(
+            **(fields.projection(required=('id', 'user'), computed=COMPUTED_FIELDS) if fields else {})
+        )
         posts = response.get('Items', [])
         logger.info(f"Found {len(posts)} posts")
         
         # Fetch user details for each post
-        for post in posts:
-            user_id = post.get('user')
-            if user_id:
-                user_response = user_table.get_item(Key={'id': user_id})
-                if 'Item' in user_response:
-                    post['user_detail'] = user_response['Item']
-                else:
-                    post['user_detail'] = None
-            post_id = post.get('id')
-            existing_like = None
-            existing_like = like_table.scan(
-                FilterExpression=(
-                    Attr('associated_id').eq(post_id)
-                )
-            )
-            
-            if existing_like and existing_like.get('Items'):
-                # return the number of likes
-                num_likes = len(existing_like['Items'])
-                post['number_likes'] = num_likes
-            else:
-                post['number_likes'] = 0
-                
-            existing_comments = None
-            existing_comments = comment_table.scan(
-                FilterExpression=(
-                    Attr('post_id').eq(post_id)
-                )
-            )
-            
-            if existing_comments and existing_comments.get('Items'):
-                # return the number of likes
-                num_comments = len(existing_comments['Items'])
-                post['number_comments'] = num_comments
-            else:
-                post['number_comments'] = 0
+        posts = [add_post_details(post, fields) for post in posts]
         
         return response_payload(None, posts)
     except ClientError as e:
@@ -253,6 +254,17 @@ def update_post(event,user):
         return response_payload(f'Error updating post: {e}', None)
 
 
+def queue_cleanup(item_type, item_id):
+    if not CLEANUP_QUEUE_URL:
+        logger.warning(f"CLEANUP_QUEUE_URL not set, children of {item_type} {item_id} are kept")
+        return
+    try:
+        sqs.send_message(QueueUrl=CLEANUP_QUEUE_URL, MessageBody=json.dumps({"type": item_type, "id": item_id}))
+    except ClientError as e:
+        # the post itself is gone, leftovers are only wasted space
+        logger.error(f"Error queueing cleanup of {item_type} {item_id}: {e}")
+
+
 def delete_post(event,user):
     logger.info("Deleting a post")
     post_id = event['pathParameters']['id']
@@ -264,6 +276,7 @@ def delete_post(event,user):
     try:
         table.delete_item(Key={'id': post_id})
         logger.info(f"Post deleted successfully with ID: {post_id}")
+        queue_cleanup('post', post_id)
         return response_payload(None, 'Post deleted successfully')
     except Exception as e:
         logger.error(f"Error deleting post: {e}")
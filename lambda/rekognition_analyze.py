@@ -5,8 +5,19 @@ from botocore.exceptions import ClientError
 import logging
 import base64
 import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from model_lifecycle import ensure_started, record_request
+from variant_keys import variant_key
+from retry import backoff_delay
+import hashlib
+from image_upload import upload_base64_image_dedup, strip_data_url, decoded_size, find_duplicate, remember_hash
 
 client = boto3.client('rekognition')
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
 logger = logging.getLogger()
 logger.setLevel("INFO")
 BUCKET="myapp-images-bucket"
@@ -15,6 +26,32 @@ VERSION_NAME = os.environ.get("VERSION_NAME")
 MODEL = os.environ.get("MODEL")
 MIN_CONFIDENCE=50
 
+# label results cached by image version, a HeadObject is much cheaper than an inference
+label_cache_table = dynamodb.Table(os.environ.get("LABEL_CACHE_TABLE", "rekognition_label_cache"))
+LOCAL_CACHE_SIZE = 512
+local_cache = OrderedDict()
+# batch analysis reads and writes the local cache from several threads
+local_cache_lock = threading.Lock()
+
+# requests that arrive while the model is starting wait here and are answered by the SQS trigger of this function
+PENDING_QUEUE_URL = os.environ.get("PENDING_QUEUE_URL")
+request_table = dynamodb.Table(os.environ.get("REQUEST_TABLE", "rekognition_requests"))
+sqs = boto3.client('sqs')
+# pending results are removed by the table's TTL attribute
+REQUEST_TTL_SECONDS = 86400
+
+# detect_custom_labels accepts inline image bytes up to 4 MB, larger images are analyzed from S3
+INLINE_IMAGE_BYTES = 4 * 1024 * 1024
+executor = ThreadPoolExecutor(max_workers=4)
+
+# batch analysis, images analyzed concurrently with backoff when rekognition throttles
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "5"))
+MAX_BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+BASE_BACKOFF_SECONDS = 0.25
+MAX_BACKOFF_SECONDS = 8
+THROTTLE_CODES = ("ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException")
+
 def response_payload(err, res=None):
     if err:
         error_message = str(err)
@@ -33,23 +70,300 @@ def response_payload(err, res=None):
         },
     }
 
-def show_custom_labels(model,bucket,photo, min_confidence):
-    client=boto3.client('rekognition')
+def cache_key(bucket, photo, model, min_confidence):
+    # keyed by the image the client asked for, the entry records which image was analyzed
+    return f"{bucket}/{photo}|{model}|{min_confidence}"
+
+
+def get_cached_entry(key):
+    """
+    Returns the cached {"image_key", "etag", "labels"} for the key, else None.
+    """
+    with local_cache_lock:
+        cached = local_cache.get(key)
+        if cached:
+            local_cache.move_to_end(key)
+            return cached
+    try:
+        item = label_cache_table.get_item(Key={'id': key}).get('Item')
+    except ClientError as e:
+        logger.error(f"Error reading label cache: {e}")
+        return None
+    if not item or 'image_key' not in item:
+        return None
+    entry = {"image_key": item["image_key"], "etag": item["etag"], "labels": json.loads(item["labels"])}
+    remember_labels(key, entry)
+    return entry
+
+
+def remember_labels(key, entry):
+    with local_cache_lock:
+        local_cache[key] = entry
+        local_cache.move_to_end(key)
+        while len(local_cache) > LOCAL_CACHE_SIZE:
+            local_cache.popitem(last=False)
+
+
+def put_cached_labels(key, image_key, etag, labels):
+    remember_labels(key, {"image_key": image_key, "etag": etag, "labels": labels})
+    try:
+        # labels kept as a json string, dynamodb would otherwise need every confidence as a Decimal
+        label_cache_table.put_item(Item={
+            'id': key,
+            'image_key': image_key,
+            'etag': etag,
+            'labels': json.dumps(labels),
+            'time_creation': int(time.time()),
+        })
+    except ClientError as e:
+        logger.error(f"Error writing label cache: {e}")
+
 
+def current_etag(bucket, key):
+    """
+    Returns the eTag of the object, None when it does not exist.
+    """
     try:
-        #Call DetectCustomLabels
-        response = client.detect_custom_labels(Image={'S3Object': {'Bucket': bucket, 'Name': photo}},
-            MinConfidence=min_confidence,
-            ProjectVersionArn=model)
-        return response_payload(None, {"response": response["CustomLabels"]})
+        return s3.head_object(Bucket=bucket, Key=key)['ETag']
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+    return None
+
+
+def analysis_image(bucket, photo):
+    """
+    Returns (key, eTag) of the image to analyze, the capped resolution variant made by
+    lambda-handle-sqs.py (image_variants.py) when it exists, else the original.
+    Only called on a cache miss.
+    """
+    variant = variant_key(photo, "analysis")
+    etag = current_etag(bucket, variant)
+    if etag:
+        return variant, etag
+    return photo, s3.head_object(Bucket=bucket, Key=photo)['ETag']
+
+
+class ModelNotRunning(Exception):
+    pass
+
+
+def detect_custom_labels(model, bucket, photo, min_confidence):
+    """
+    Returns the custom labels of the image, from the cache when the analyzed object has not changed.
+    The model is only needed on a cache miss; if it is not running it is started
+    and ModelNotRunning is raised.
+
+    Returns:
+        (labels, cached)
+    """
+    key = cache_key(bucket, photo, model, min_confidence)
+    entry = get_cached_entry(key)
+    # one HeadObject of the image the labels were computed from
+    if entry and current_etag(bucket, entry["image_key"]) == entry["etag"]:
+        logger.info(f"Label cache hit for {key}")
+        return entry["labels"], True
+
+    image_key, etag = analysis_image(bucket, photo)
+    if not ensure_started():
+        raise ModelNotRunning("model is starting, try again in a few minutes")
+
+    #Call DetectCustomLabels
+    response = client.detect_custom_labels(Image={'S3Object': {'Bucket': bucket, 'Name': image_key}},
+        MinConfidence=min_confidence,
+        ProjectVersionArn=model)
+    labels = response["CustomLabels"]
+    put_cached_labels(key, image_key, etag, labels)
+    return labels, False
+
+
+def queue_request(user, bucket, photo):
+    request_id = str(uuid.uuid4())
+    request_table.put_item(Item={
+        'id': request_id,
+        'user': user,
+        'image_key': photo,
+        'status': 'PENDING',
+        'time_creation': int(time.time()),
+        'ttl': int(time.time()) + REQUEST_TTL_SECONDS,
+    })
+    sqs.send_message(
+        QueueUrl=PENDING_QUEUE_URL,
+        MessageBody=json.dumps({"request_id": request_id, "bucket": bucket, "image_key": photo})
+    )
+    logger.info(f"Model not running, queued request {request_id}")
+    return request_id
+
+
+def get_queued_request(request_id, user):
+    try:
+        item = request_table.get_item(Key={'id': request_id}).get('Item')
+        if not item or item['user'] != user:
+            return response_payload('Request not found')
+        result = {"request_id": request_id, "status": item['status'], "image_key": item['image_key']}
+        if item['status'] == 'DONE':
+            result["response"] = json.loads(item['labels'])
+        return response_payload(None, result)
+    except ClientError as e:
+        logger.error(f"Error getting queued request: {e}")
+        return response_payload(e)
+
+
+def show_custom_labels(model,bucket,photo, min_confidence, user=None):
+    try:
+        labels, cached = detect_custom_labels(model, bucket, photo, min_confidence)
+        return response_payload(None, {"response": labels, "cached": cached})
+    except ModelNotRunning as e:
+        if not PENDING_QUEUE_URL:
+            return response_payload(e)
+        request_id = queue_request(user, bucket, photo)
+        return response_payload(None, {"status": "PENDING", "request_id": request_id})
     except Exception as e:
         logger.error(e)
         return response_payload(e)
         
     logger.info("done check model")
 
+
+def upload_and_analyze(user, data, model=MODEL, bucket=BUCKET, min_confidence=MIN_CONFIDENCE):
+    """
+    Stores the base64 image and returns its labels in one request.
+
+    The decoded bytes go to detect_custom_labels inline while the S3 write runs
+    in parallel, so rekognition doesn't read the image back from S3.
+    """
+    image_data = data.get("image")
+    if not image_data:
+        return response_payload("image must be provided")
+    image_key = f"image_rekognition/{user}/{uuid.uuid4()}.jpg"
+    image_url = f"https://{bucket}.s3.amazonaws.com/{image_key}"
+    result = {"image_key": image_key, "image_url": image_url}
+    try:
+        scope = f"image_rekognition/{user}"
+        offset = strip_data_url(image_data)
+        if decoded_size(image_data, offset) > INLINE_IMAGE_BYTES:
+            image_key, duplicate = upload_base64_image_dedup(s3, bucket, scope, image_key, image_data, 'image/jpeg')
+            result.update({"image_key": image_key, "image_url": f"https://{bucket}.s3.amazonaws.com/{image_key}",
+                           "duplicate": duplicate})
+            labels, cached = detect_custom_labels(model, bucket, image_key, min_confidence)
+            result.update({"response": labels, "cached": cached})
+            return response_payload(None, result)
+
+        image_bytes = base64.b64decode(image_data[offset:])
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        existing = find_duplicate(s3, bucket, scope, digest)
+        if existing:
+            # already stored, its labels are most likely cached; a queued request refers to it too
+            image_key = existing
+            result.update({"image_key": existing, "image_url": f"https://{bucket}.s3.amazonaws.com/{existing}",
+                           "duplicate": True})
+            labels, cached = detect_custom_labels(model, bucket, existing, min_confidence)
+            result.update({"response": labels, "cached": cached})
+            return response_payload(None, result)
+
+        upload = executor.submit(s3.put_object, Bucket=bucket, Key=image_key, Body=image_bytes, ContentType='image/jpeg')
+        labels = None
+        if ensure_started():
+            labels = client.detect_custom_labels(Image={'Bytes': image_bytes},
+                MinConfidence=min_confidence,
+                ProjectVersionArn=model)["CustomLabels"]
+        etag = upload.result()['ETag']
+        remember_hash(scope, digest, image_key)
+        logger.info(f"Image uploaded successfully to {image_url}")
+        if labels is None:
+            raise ModelNotRunning("model is starting, try again in a few minutes")
+        # a later GET with this image_key is answered from the cache, the labels are of the
+        # original, the entry stays valid after the analysis variant is created
+        put_cached_labels(cache_key(bucket, image_key, model, min_confidence), image_key, etag, labels)
+        result.update({"response": labels, "cached": False, "duplicate": False})
+        return response_payload(None, result)
+    except ModelNotRunning as e:
+        if not PENDING_QUEUE_URL:
+            return response_payload(e)
+        result.update({"status": "PENDING", "request_id": queue_request(user, bucket, image_key)})
+        return response_payload(None, result)
+    except Exception as e:
+        logger.error(f"Error in upload and analyze: {e}")
+        return response_payload(e)
+
+
+def detect_with_backoff(model, bucket, photo, min_confidence):
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return detect_custom_labels(model, bucket, photo, min_confidence)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLE_CODES or attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = backoff_delay(attempt, BASE_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+            logger.warning(f"Throttled analyzing {photo}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def analyze_batch(user, data, model=MODEL, bucket=BUCKET, min_confidence=MIN_CONFIDENCE):
+    """
+    Labels a list of images, cached results are reused.
+
+    Returns one result per image_key in input order, each with either
+    "response", a queued "request_id" or an "error".
+    """
+    if not isinstance(data, dict):
+        return response_payload("body must be a JSON object")
+    image_keys = data.get("image_keys")
+    if (not isinstance(image_keys, list) or not image_keys or len(image_keys) > MAX_BATCH_SIZE
+            or not all(isinstance(key, str) and key for key in image_keys)):
+        return response_payload(f"image_keys must be a list of 1 to {MAX_BATCH_SIZE} keys")
+    concurrency = data.get("concurrency", BATCH_CONCURRENCY)
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+        return response_payload("concurrency must be a positive integer")
+    concurrency = min(concurrency, BATCH_CONCURRENCY)
+
+    def analyze(photo):
+        try:
+            labels, cached = detect_with_backoff(model, bucket, photo, min_confidence)
+            return {"image_key": photo, "response": labels, "cached": cached}
+        except ModelNotRunning as e:
+            if not PENDING_QUEUE_URL:
+                return {"image_key": photo, "error": {"message": str(e)}}
+            return {"image_key": photo, "status": "PENDING", "request_id": queue_request(user, bucket, photo)}
+        except Exception as e:
+            logger.error(f"Error analyzing {photo}: {e}")
+            return {"image_key": photo, "error": {"message": str(e)}}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as batch_executor:
+        results = list(batch_executor.map(analyze, image_keys))
+    errors = sum(1 for result in results if "error" in result)
+    logger.info(f"Analyzed {len(results)} images, {errors} errors")
+    return response_payload(None, {"results": results})
+
+
+def process_queued_requests(event):
+    """
+    SQS trigger, answers queued requests once the model is running.
+    Messages that can't be answered yet are reported as failures so SQS redelivers them.
+    """
+    failures = []
+    for record in event['Records']:
+        message = json.loads(record['body'])
+        try:
+            labels, _ = detect_custom_labels(MODEL, message['bucket'], message['image_key'], MIN_CONFIDENCE)
+            request_table.update_item(
+                Key={'id': message['request_id']},
+                UpdateExpression="SET #status = :status, labels = :labels",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":status": "DONE", ":labels": json.dumps(labels)}
+            )
+            logger.info(f"Answered queued request {message['request_id']}")
+        except ModelNotRunning:
+            failures.append({"itemIdentifier": record['messageId']})
+        except Exception as e:
+            logger.error(f"Error answering queued request {message['request_id']}: {e}")
+            failures.append({"itemIdentifier": record['messageId']})
+    return {"batchItemFailures": failures}
+
 def lambda_handler(event, context):
     logger.info(f"Received event: {event}")
+    if "Records" in event:
+        return process_queued_requests(event)
     user = "test"
     if "authorizer" in event["requestContext"]:
         user = event["requestContext"]["authorizer"]["claims"]["sub"]
@@ -63,6 +377,10 @@ def lambda_handler(event, context):
         if query_string_parameters is None:
             query_string_parameters = {}
     
+        request_id = query_string_parameters.get('request_id', None)
+        if request_id:
+            return get_queued_request(request_id, user)
+
         photo = query_string_parameters.get('image_key', None)
     
         # Ensure at least one of post_id or comment_id is provided
@@ -71,7 +389,18 @@ def lambda_handler(event, context):
             logger.error(error_message)
             return response_payload(error_message, None)
             
-        return show_custom_labels(MODEL,BUCKET,photo,MIN_CONFIDENCE)
+        record_request()
+        return show_custom_labels(MODEL,BUCKET,photo,MIN_CONFIDENCE,user)
+    elif http_method == 'POST':
+        try:
+            data = json.loads(event["body"] or "{}")
+        except ValueError as e:
+            return response_payload(f"Invalid JSON body: {e}")
+        record_request()
+        if event.get('resource', '').endswith('/batch'):
+            return analyze_batch(user, data)
+        # upload and analyze in one round trip
+        return upload_and_analyze(user, data)
     else:
         logger.error(f"Unsupported HTTP method: {http_method}")
         return response_payload("Method Not Allowed")
@@ -2,8 +2,8 @@ import json
 import boto3
 import logging
 import os
+from model_lifecycle import get_model_status
 
-client = boto3.client('rekognition')
 logger = logging.getLogger()
 logger.setLevel("INFO")
 PROJECT_ARN = os.environ.get("PROJECT_ARN")
@@ -28,18 +28,14 @@ def response_payload(err, res=None):
         },
     }
 
-def check_model(project_arn, version_name):
+def check_model(project_arn, version_name, refresh=False):
     logger.info("check model...")
     try:
-        # Get the running status
-        describe_response = client.describe_project_versions(ProjectArn=project_arn, VersionNames=[version_name])
-        print(describe_response)
-        for model in describe_response['ProjectVersionDescriptions']:
-            status = model['Status']
-            status_message = model['StatusMessage']
-            logger.info(f"Status: {status}")
-            logger.info(f"Message: {status_message}")
-            return response_payload(None, {"Status": status, "StatusMessage": status_message})
+        # Get the running status, cached for MODEL_STATUS_TTL_SECONDS unless refresh is asked for
+        model = get_model_status(force=refresh)
+        logger.info(f"Status: {model['Status']}")
+        logger.info(f"Message: {model['StatusMessage']}")
+        return response_payload(None, {"Status": model['Status'], "StatusMessage": model['StatusMessage']})
     except Exception as e:
         logger.error(e)
         return response_payload(e)
@@ -53,7 +49,9 @@ def lambda_handler(event, context):
         
     http_method = event['httpMethod']
     if http_method == 'GET':
-        return check_model(PROJECT_ARN, VERSION_NAME)
+        query_string_parameters = event.get('queryStringParameters') or {}
+        refresh = query_string_parameters.get('refresh') == 'true'
+        return check_model(PROJECT_ARN, VERSION_NAME, refresh)
     else:
         logger.error(f"Unsupported HTTP method: {http_method}")
         return response_payload("Method Not Allowed")
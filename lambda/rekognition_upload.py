@@ -2,6 +2,7 @@ import json
 import boto3
 import logging
 import base64
+from image_upload import upload_base64_image_dedup
 import uuid
 from botocore.exceptions import ClientError
 
@@ -16,17 +17,14 @@ def upload_image_to_s3(user_id, data):
     image_data = data.pop("image", None)
     
     try:
-        image_decoded = base64.b64decode(image_data)
         image_key = f"image_rekognition/{user_id}/{uuid.uuid4()}.jpg"
-        s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=image_key,
-            Body=image_decoded,
-            ContentType='image/jpeg'
-        )
+        # decoded a slice at a time, large images go up as a multipart upload
+        # an image the user already uploaded resolves to the stored copy
+        image_key, duplicate = upload_base64_image_dedup(
+            s3, BUCKET_NAME, f"image_rekognition/{user_id}", image_key, image_data, 'image/jpeg')
         image_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{image_key}"
         logger.info(f"Image uploaded successfully to {image_url}")
-        return response_payload(None, {"image_url": image_url, "image_key": image_key})
+        return response_payload(None, {"image_url": image_url, "image_key": image_key, "duplicate": duplicate})
     except Exception as e:
         logger.error(f"Error uploading image: {e}")
         return response_payload(e)
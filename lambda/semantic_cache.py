@@ -0,0 +1,201 @@
+import os
+import io
+import json
+import time
+import uuid
+import threading
+import boto3
+import logging
+import numpy as np
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+# https://docs.aws.amazon.com/bedrock/latest/userguide/model-parameters-titan-embed-text.html
+EMBEDDING_MODEL_ID = os.environ.get("CACHE_EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v2:0")
+EMBEDDING_DIMENSIONS = int(os.environ.get("CACHE_EMBEDDING_DIMENSIONS", "512"))
+# cosine similarity a cached question needs to be reused, tune with the CacheSimilarity metric
+SIMILARITY_THRESHOLD = float(os.environ.get("CACHE_SIMILARITY_THRESHOLD", "0.92"))
+MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "20000"))
+# index is kept in S3 when CACHE_BUCKET is set so every container shares it, /tmp otherwise
+CACHE_BUCKET = os.environ.get("CACHE_BUCKET")
+CACHE_KEY = os.environ.get("CACHE_KEY", "semantic-cache/kb-answers")
+CACHE_DIR = os.environ.get("CACHE_DIR", "/tmp/semantic-cache")
+# a save rewrites the whole index, so single answers are saved in the background once
+# SAVE_EVERY of them are pending or the oldest pending one is SAVE_INTERVAL_SECONDS old
+SAVE_EVERY = int(os.environ.get("CACHE_SAVE_EVERY", "25"))
+SAVE_INTERVAL_SECONDS = int(os.environ.get("CACHE_SAVE_INTERVAL_SECONDS", "300"))
+
+bedrock_runtime = boto3.client('bedrock-runtime')
+s3 = boto3.client('s3')
+
+
+def embed(text):
+    """
+    Returns the unit length embedding of the text as a float32 vector.
+    """
+    response = bedrock_runtime.invoke_model(
+        body=json.dumps({"inputText": text, "dimensions": EMBEDDING_DIMENSIONS, "normalize": True}),
+        modelId=EMBEDDING_MODEL_ID,
+        accept="application/json",
+        contentType="application/json"
+    )
+    vector = np.asarray(json.loads(response["body"].read())["embedding"], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """
+    Answers keyed by question embedding, looked up by cosine similarity.
+
+    Vectors are stored normalized in one (n, d) matrix so a lookup is a single
+    matrix-vector product. Entries carry a scope (the retrieval settings used to
+    produce the answer) and only match questions asked with the same scope.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.vectors = np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        self.entries = []
+        self.loaded = False
+        # batch mode looks up and adds from several threads
+        self.lock = threading.RLock()
+        # held for a whole save, S3 reads and writes happen outside self.lock
+        self.save_lock = threading.Lock()
+        self.unsaved = 0
+        self.unsaved_since = None
+
+    def lookup(self, vector, scope):
+        """
+        Returns (entry, similarity) of the closest entry in the scope.
+        entry is None when the closest one is below the threshold.
+        """
+        with self.lock:
+            self.load()
+            vectors, entries = self.vectors, self.entries
+        if not entries:
+            return None, None
+        similarities = vectors @ vector
+        in_scope = np.array([entry["scope"] == scope for entry in entries])
+        similarities = np.where(in_scope, similarities, -1.0)
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < 0:
+            return None, None
+        if similarity >= self.threshold:
+            return entries[best], similarity
+        return None, similarity
+
+    def add(self, vector, scope, question, answer, save=True):
+        """
+        Adds an answer. With save=True it is written with the next background save,
+        pass save=False when adding many and call save() once at the end.
+        """
+        with self.lock:
+            self.load()
+            # build new objects rather than appending so concurrent lookups see a consistent pair
+            self.vectors = np.vstack([self.vectors, vector[np.newaxis, :]])
+            self.entries = self.entries + [{
+                "id": str(uuid.uuid4()),
+                "scope": scope,
+                "question": question,
+                "answer": answer,
+                "created": int(time.time()),
+            }]
+            self.unsaved += 1
+            self.unsaved_since = self.unsaved_since or time.time()
+            due = self.unsaved >= SAVE_EVERY or time.time() - self.unsaved_since >= SAVE_INTERVAL_SECONDS
+        if save and due:
+            self.save_in_background()
+
+    def save_in_background(self):
+        """
+        Starts a save unless one is running. Lambda freezes the container after the
+        response, a save that has not finished completes during the next invocation.
+        """
+        if self.save_lock.locked():
+            return
+        threading.Thread(target=self.save, daemon=True).start()
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            vectors, entries = self._read()
+        except Exception as e:
+            logger.warning(f"Semantic cache not loaded, starting empty: {e}")
+            return
+        if vectors.shape[1:] == (EMBEDDING_DIMENSIONS,) and len(entries) == len(vectors):
+            self.vectors, self.entries = vectors, entries
+            logger.info(f"Semantic cache loaded with {len(entries)} entries")
+        else:
+            logger.warning("Semantic cache has a different embedding size, starting empty")
+
+    def save(self):
+        """
+        Merges with the stored index before writing so entries added by other
+        containers since this one loaded are kept. Lookups and adds are only
+        blocked while merging in memory, not during the S3 calls.
+        """
+        with self.save_lock:
+            try:
+                stored = self._read()
+            except Exception:
+                stored = None
+            with self.lock:
+                self._merge(stored)
+                vectors, entries = self.vectors, self.entries
+                self.unsaved, self.unsaved_since = 0, None
+            try:
+                self._write(vectors, entries)
+            except Exception as e:
+                logger.error(f"Error saving semantic cache: {e}")
+
+    def _merge(self, stored):
+        if stored is not None:
+            stored_vectors, stored_entries = stored
+            known = {entry["id"] for entry in self.entries}
+            keep = [i for i, entry in enumerate(stored_entries) if entry["id"] not in known]
+            if keep and stored_vectors.shape[1:] == (EMBEDDING_DIMENSIONS,):
+                self.vectors = np.vstack([stored_vectors[keep], self.vectors])
+                self.entries = [stored_entries[i] for i in keep] + self.entries
+        if len(self.entries) > self.max_entries:
+            order = np.argsort([entry["created"] for entry in self.entries], kind="stable")[-self.max_entries:]
+            self.vectors = self.vectors[order]
+            self.entries = [self.entries[i] for i in order]
+
+    def _read(self):
+        if CACHE_BUCKET:
+            try:
+                vectors = s3.get_object(Bucket=CACHE_BUCKET, Key=f"{CACHE_KEY}.npy")["Body"].read()
+                entries = s3.get_object(Bucket=CACHE_BUCKET, Key=f"{CACHE_KEY}.json")["Body"].read()
+            except ClientError as e:
+                if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                    return np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32), []
+                raise
+            return np.load(io.BytesIO(vectors)), json.loads(entries)
+        path = os.path.join(CACHE_DIR, os.path.basename(CACHE_KEY))
+        if not os.path.exists(f"{path}.npy"):
+            return np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32), []
+        with open(f"{path}.json") as f:
+            entries = json.load(f)
+        return np.load(f"{path}.npy"), entries
+
+    def _write(self, vectors, entries):
+        buffer = io.BytesIO()
+        np.save(buffer, vectors)
+        entries = json.dumps(entries).encode("utf-8")
+        if CACHE_BUCKET:
+            s3.put_object(Bucket=CACHE_BUCKET, Key=f"{CACHE_KEY}.npy", Body=buffer.getvalue())
+            s3.put_object(Bucket=CACHE_BUCKET, Key=f"{CACHE_KEY}.json", Body=entries, ContentType="application/json")
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = os.path.join(CACHE_DIR, os.path.basename(CACHE_KEY))
+        with open(f"{path}.npy", "wb") as f:
+            f.write(buffer.getvalue())
+        with open(f"{path}.json", "wb") as f:
+            f.write(entries)
@@ -0,0 +1,109 @@
+import json
+import uuid
+import boto3
+import logging
+
+# Issues presigned urls so clients upload images straight to S3 instead of sending
+# base64 through API Gateway and Lambda. The record update (e.g. profile_image_url)
+# happens when the S3 notification for the new object reaches lambda-handle-sqs.py.
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+s3 = boto3.client('s3')
+BUCKET_NAME = 'myapp-images-bucket'
+
+URL_EXPIRES_SECONDS = 300
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+# purpose -> key prefix, must match the prefixes lambda-handle-sqs.py finalizes
+PREFIXES = {
+    "profile": "profile_images",
+    "rekognition": "image_rekognition",
+}
+
+
+def lambda_handler(event, context):
+    logger.info(f"Received event: {event}")
+    user = "test"
+    if "authorizer" in event["requestContext"]:
+        user = event["requestContext"]["authorizer"]["claims"]["sub"]
+
+    http_method = event['httpMethod']
+    if http_method == 'POST':
+        data = json.loads(event["body"] or "{}")
+        return create_upload_url(user, data)
+    else:
+        logger.error(f"Unsupported HTTP method: {http_method}")
+        return response_payload("Method Not Allowed")
+
+
+def create_upload_url(user, data):
+    purpose = data.get("purpose", "profile")
+    content_type = data.get("content_type", "image/jpeg")
+    method = data.get("method", "POST").upper()
+    if purpose not in PREFIXES:
+        return response_payload(f"purpose must be one of {sorted(PREFIXES)}")
+    if content_type not in CONTENT_TYPES:
+        return response_payload(f"content_type must be one of {sorted(CONTENT_TYPES)}")
+    if method not in ("POST", "PUT"):
+        return response_payload("method must be POST or PUT")
+
+    image_key = f"{PREFIXES[purpose]}/{user}/{uuid.uuid4()}.{CONTENT_TYPES[content_type]}"
+    try:
+        if method == "POST":
+            # a POST policy can enforce the size limit, prefer it for browsers
+            presigned = s3.generate_presigned_post(
+                Bucket=BUCKET_NAME,
+                Key=image_key,
+                Fields={"Content-Type": content_type},
+                Conditions=[
+                    {"Content-Type": content_type},
+                    ["content-length-range", 1, MAX_IMAGE_BYTES],
+                ],
+                ExpiresIn=URL_EXPIRES_SECONDS
+            )
+            result = {"url": presigned["url"], "fields": presigned["fields"]}
+        else:
+            # a presigned PUT only pins the content type, the size is checked when the upload is finalized
+            url = s3.generate_presigned_url(
+                "put_object",
+                Params={"Bucket": BUCKET_NAME, "Key": image_key, "ContentType": content_type},
+                ExpiresIn=URL_EXPIRES_SECONDS
+            )
+            result = {"url": url, "headers": {"Content-Type": content_type}}
+        result.update({
+            "method": method,
+            "image_key": image_key,
+            "image_url": f"https://{BUCKET_NAME}.s3.amazonaws.com/{image_key}",
+            "expires_in": URL_EXPIRES_SECONDS,
+            "max_bytes": MAX_IMAGE_BYTES,
+        })
+        logger.info(f"Upload url issued for {image_key}")
+        return response_payload(None, result)
+    except Exception as e:
+        logger.error(f"Error creating upload url: {e}")
+        return response_payload(e)
+
+
+def response_payload(err, res=None):
+    if err:
+        error_message = str(err)
+        status_code = 502
+        response_body = {"error": {"message": error_message}}
+    else:
+        status_code = 200
+        response_body = res
+
+    return {
+        "statusCode": status_code,
+        "body": json.dumps(response_body),
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+    }
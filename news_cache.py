@@ -0,0 +1,199 @@
+import os
+import time
+import gzip
+import boto3
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from botocore.exceptions import ClientError
+
+# Cache in front of NewsAPI for news.py in lambda/ and api.py at the repository root.
+# lambda/news_cache.py and news_cache.py are the same file, the two directories are
+# deployed as separate bundles.
+#
+# Two levels: a dict in the container and an item per key in NEWS_CACHE_TABLE, so a new
+# container starts warm. Entries are fresh for TTL_SECONDS, then served stale for up to
+# MAX_STALE_SECONDS while one background refresh runs. Concurrent misses for a key in a
+# container wait for the same upstream call, and across containers a short lease item
+# stops every container refreshing the same key at once.
+#
+# Lambda freezes the container between invocations, so a background refresh that has not
+# finished when the response is returned completes during the next invocation.
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+TTL_SECONDS = int(os.environ.get("NEWS_CACHE_TTL_SECONDS", "300"))
+MAX_STALE_SECONDS = int(os.environ.get("NEWS_CACHE_MAX_STALE_SECONDS", "3600"))
+LEASE_SECONDS = 30
+# (connect, read) seconds for every upstream call
+TIMEOUT = (2, 5)
+
+cache_table = boto3.resource('dynamodb').Table(os.environ.get("NEWS_CACHE_TABLE", "news_cache"))
+
+
+def create_session():
+    """
+    One pooled session per container, connections to newsapi.org are kept alive between requests.
+    """
+    session = requests.Session()
+    # no retry after a read timeout, that would multiply the time a slow NewsAPI costs
+    retry = Retry(total=2, read=0, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+
+session = create_session()
+
+
+class Entry:
+    """
+    A cached response body, kept gzip compressed so it can be returned with
+    Content-Encoding: gzip as is, or decompressed once for other clients.
+    """
+    __slots__ = ("compressed", "fetched_at", "_body")
+
+    def __init__(self, compressed, fetched_at, body=None):
+        self.compressed = compressed
+        self.fetched_at = fetched_at
+        self._body = body
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = gzip.decompress(self.compressed).decode("utf-8")
+        return self._body
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+def compress(body):
+    # mtime=0 keeps the bytes identical for identical bodies
+    return gzip.compress(body.encode("utf-8"), mtime=0)
+
+
+class NewsCache:
+    """
+    Stale-while-revalidate cache of serialized response bodies.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+        # key -> Event set when the in-flight load finishes
+        self.in_flight = {}
+
+    def get(self, key, loader):
+        """
+        Returns the Entry for the key, calling loader() -> str on a miss.
+        Raises whatever loader raises when there is nothing usable cached.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry.age() >= TTL_SECONDS:
+            # another container may have refreshed it already
+            stored = self._read(key)
+            if stored is not None and (entry is None or stored.fetched_at > entry.fetched_at):
+                entry = stored
+        if entry is not None:
+            self.entries[key] = entry
+            if entry.age() < TTL_SECONDS:
+                return entry
+            if entry.age() < MAX_STALE_SECONDS:
+                self._refresh_in_background(key, loader)
+                return entry
+        return self._load(key, loader)
+
+    def peek(self, key):
+        """
+        Returns the newest entry for the key whatever its age, or None. Does not call upstream.
+        """
+        entry = self.entries.get(key)
+        stored = self._read(key) if entry is None or entry.age() >= TTL_SECONDS else None
+        if stored is not None and (entry is None or stored.fetched_at > entry.fetched_at):
+            entry = self.entries[key] = stored
+        return entry
+
+    def _load(self, key, loader):
+        """
+        Single flight: the first caller loads, the others wait for its result.
+        """
+        with self.lock:
+            event = self.in_flight.get(key)
+            leader = event is None
+            if leader:
+                event = self.in_flight[key] = threading.Event()
+        if not leader:
+            event.wait(sum(TIMEOUT) * 3)
+            entry = self.entries.get(key)
+            if entry is not None and entry.age() < MAX_STALE_SECONDS:
+                return entry
+            # the leader failed, try once ourselves
+            return self.put(key, loader())
+        try:
+            return self.put(key, loader())
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+            event.set()
+
+    def _refresh_in_background(self, key, loader):
+        with self.lock:
+            if key in self.in_flight:
+                return
+        if not self._acquire_lease(key):
+            return
+
+        def refresh():
+            try:
+                self._load(key, loader)
+                logger.info(f"Refreshed {key} in the background")
+            except Exception as e:
+                logger.error(f"Background refresh of {key} failed, serving stale: {e}")
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def put(self, key, body):
+        """
+        Stores a serialized body, also used by the scheduled pre-fetch in news.py.
+        """
+        entry = Entry(compress(body), time.time(), body)
+        self.entries[key] = entry
+        try:
+            cache_table.put_item(Item={
+                'id': key,
+                # compressed, headlines are several times smaller and well inside the item size limit
+                'body': entry.compressed,
+                'fetched_at': int(entry.fetched_at),
+            })
+        except ClientError as e:
+            logger.error(f"Error writing news cache: {e}")
+        return entry
+
+    def _read(self, key):
+        try:
+            item = cache_table.get_item(Key={'id': key}).get('Item')
+        except ClientError as e:
+            logger.error(f"Error reading news cache: {e}")
+            return None
+        if not item or 'body' not in item:
+            return None
+        return Entry(item['body'].value, int(item['fetched_at']))
+
+    def _acquire_lease(self, key):
+        now = int(time.time())
+        try:
+            cache_table.put_item(
+                Item={'id': f"{key}#lease", 'expires_at': now + LEASE_SECONDS},
+                ConditionExpression="attribute_not_exists(id) OR expires_at < :now",
+                ExpressionAttributeValues={":now": now}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            logger.error(f"Error acquiring refresh lease: {e}")
+            return True
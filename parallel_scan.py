@@ -0,0 +1,122 @@
+import queue
+import logging
+import threading
+from botocore.exceptions import ClientError
+from projection import projection_params
+from retry import AdaptiveLimiter, DYNAMODB_THROTTLE_CODES, sleep_backoff
+
+# Parallel Scan of a whole DynamoDB table, for full-table reads in
+# lambda-api-gateway-from-aws2.py and crud_dynamo.py.
+# https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Scan.html#Scan.ParallelScan
+#
+# The table is split into TotalSegments segments, each scanned page after page by its own
+# thread. Pages are yielded as soon as any segment returns one, in no particular order. At
+# most QUEUED_PAGES_PER_SEGMENT pages per segment wait in memory, a slow consumer slows the
+# scan down instead of buffering the table.
+#
+# Throttling lowers the number of segments scanned at the same time (halved, grows back by
+# one slot every `limit` pages, AIMD) and the throttled page is retried after a jittered backoff.
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+DEFAULT_SEGMENTS = 8
+MAX_SEGMENTS = 64
+QUEUED_PAGES_PER_SEGMENT = 2
+MAX_ATTEMPTS = 8
+BASE_BACKOFF_SECONDS = 0.1
+MAX_BACKOFF_SECONDS = 5
+
+
+def scan_page(table, params, limiter):
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with limiter:
+                response = table.scan(**params)
+            limiter.success()
+            return response
+        except ClientError as e:
+            if e.response['Error']['Code'] not in DYNAMODB_THROTTLE_CODES or attempt == MAX_ATTEMPTS - 1:
+                raise
+            limiter.throttled()
+            sleep_backoff(attempt, BASE_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+
+
+def parallel_scan(table, total_segments=DEFAULT_SEGMENTS, attributes=None, page_size=None, **scan_kwargs):
+    """
+    Scans the whole table with total_segments threads and yields the pages as they arrive.
+
+    Args:
+        table: boto3 Table resource
+        total_segments: 1 is an ordinary sequential scan
+        attributes: attribute names to return, default all
+        page_size: Limit of each Scan call
+        scan_kwargs: passed to every Scan call, e.g. FilterExpression
+    Returns:
+        generator of lists of items
+    """
+    total_segments = max(1, min(int(total_segments), MAX_SEGMENTS))
+    base_params = dict(scan_kwargs)
+    if attributes:
+        base_params.update(projection_params(attributes))
+    if page_size:
+        base_params['Limit'] = page_size
+
+    pages = queue.Queue(maxsize=total_segments * QUEUED_PAGES_PER_SEGMENT)
+    stop = threading.Event()
+    limiter = AdaptiveLimiter(total_segments, "Scan")
+    done = object()
+
+    def put(value):
+        # gives up when the consumer stopped reading
+        while not stop.is_set():
+            try:
+                pages.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan_segment(segment):
+        params = dict(base_params)
+        if total_segments > 1:
+            params.update(Segment=segment, TotalSegments=total_segments)
+        try:
+            while not stop.is_set():
+                response = scan_page(table, params, limiter)
+                if not put(response.get('Items', [])):
+                    return
+                if 'LastEvaluatedKey' not in response:
+                    break
+                params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    threads = [threading.Thread(target=scan_segment, args=(segment,), daemon=True)
+               for segment in range(total_segments)]
+    for thread in threads:
+        thread.start()
+
+    remaining = total_segments
+    try:
+        while remaining:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        # also runs when the consumer closes the generator early
+        stop.set()
+
+
+def scan_items(table, total_segments=DEFAULT_SEGMENTS, attributes=None, **kwargs):
+    """
+    Same as parallel_scan, one item at a time.
+    """
+    for page in parallel_scan(table, total_segments, attributes, **kwargs):
+        yield from page
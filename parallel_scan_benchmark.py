@@ -0,0 +1,90 @@
+import sys
+import time
+import argparse
+import threading
+import boto3
+from botocore.exceptions import ClientError
+from parallel_scan import parallel_scan
+
+# Scan throughput against the number of segments.
+#   python parallel_scan_benchmark.py --table vehicles --segments 1,2,4,8,16
+#   python parallel_scan_benchmark.py --table vehicles --endpoint-url http://localhost:8000   (DynamoDB Local)
+#   python parallel_scan_benchmark.py --simulated 200000
+# --simulated needs no AWS: an in-memory table that answers a page of PAGE_ITEMS items after
+# --latency-ms and throttles above --max-pages-per-second, roughly what a real table does
+# for ~1 KB items. Run it from a copy of this file and parallel_scan.py outside the repo
+# root, the root logging.py shadows the standard library module.
+
+PAGE_ITEMS = 1000
+
+
+class SimulatedTable:
+    def __init__(self, item_count, latency_ms, max_pages_per_second):
+        self.items = [{'id': str(i), 'name': f"item {i}", 'payload': "x" * 900} for i in range(item_count)]
+        self.latency = latency_ms / 1000
+        self.max_pages_per_second = max_pages_per_second
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.pages_in_window = 0
+
+    def consume_capacity(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start, self.pages_in_window = now, 0
+            self.pages_in_window += 1
+            if self.max_pages_per_second and self.pages_in_window > self.max_pages_per_second:
+                raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': ''}}, 'Scan')
+
+    def scan(self, Segment=0, TotalSegments=1, ExclusiveStartKey=None, Limit=PAGE_ITEMS, **kwargs):
+        time.sleep(self.latency)
+        self.consume_capacity()
+        # segment i holds every TotalSegments-th item, like a hash split
+        start = int(ExclusiveStartKey['position']) if ExclusiveStartKey else Segment
+        step = TotalSegments
+        stop = min(len(self.items), start + step * min(Limit, PAGE_ITEMS))
+        response = {'Items': self.items[start:stop:step]}
+        if stop < len(self.items):
+            response['LastEvaluatedKey'] = {'position': stop}
+        return response
+
+
+def run(table, segments, attributes):
+    start = time.perf_counter()
+    items = pages = 0
+    for page in parallel_scan(table, segments, attributes):
+        pages += 1
+        items += len(page)
+    return items, pages, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--table")
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--simulated", type=int, help="number of items of an in-memory table")
+    parser.add_argument("--latency-ms", type=float, default=25)
+    parser.add_argument("--max-pages-per-second", type=int, default=0, help="simulated throttling, 0 for none")
+    parser.add_argument("--segments", default="1,2,4,8,16,32")
+    parser.add_argument("--attributes", help="comma separated projection")
+    args = parser.parse_args()
+
+    if args.simulated:
+        table = SimulatedTable(args.simulated, args.latency_ms, args.max_pages_per_second)
+    elif args.table:
+        table = boto3.resource('dynamodb', endpoint_url=args.endpoint_url).Table(args.table)
+    else:
+        parser.error("--table or --simulated is required")
+    attributes = args.attributes.split(",") if args.attributes else None
+
+    baseline = None
+    for segments in (int(s) for s in args.segments.split(",")):
+        items, pages, elapsed = run(table, segments, attributes)
+        baseline = baseline or elapsed
+        print(f"{segments:>3} segments: {items} items in {pages} pages, {elapsed:.2f}s, "
+              f"{items / elapsed:,.0f} items/s, {baseline / elapsed:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import re
+
+# ?fields= support for the read endpoints: posts.py, comments.py, like.py and my-profile.py
+# in lambda/, the vehicles functions at the repository root. lambda/projection.py and
+# projection.py are the same file, the two directories are deployed as separate bundles.
+#
+#   ?fields=id,text,number_likes,user_detail.name,user_detail.profile_image_url
+#
+# Top level names become the ProjectionExpression of the read. "parent.child" selects
+# attributes of an object the endpoint adds itself (user_detail), which becomes the
+# projection of that lookup, or of a stored map, which is read whole and trimmed. Attributes the endpoint adds (number_likes, ...) are only
+# computed when asked for. Without ?fields= every endpoint returns whole items as before.
+
+FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$")
+MAX_FIELDS = 50
+
+
+class Fields:
+    def __init__(self, top, nested):
+        # top level names in request order, nested: parent -> child names, None for all of it
+        self.top = top
+        self.nested = nested
+
+    def wants(self, name):
+        return name in self.top or name in self.nested
+
+    def children(self, parent):
+        """
+        Requested attributes of an added object, None when the whole object was asked for.
+        """
+        return self.nested.get(parent)
+
+    def projection(self, required=(), computed=()):
+        """
+        ProjectionExpression params for the read of the main item.
+
+        Args:
+            required: attributes the endpoint needs itself, e.g. the key used for a lookup
+            computed: names the endpoint adds, not attributes of the table
+        """
+        names = [name for name in self.top + list(self.nested) if name not in computed]
+        return projection_params(list(dict.fromkeys(names + list(required))))
+
+    def trim(self, item):
+        """
+        Drops what was read or added only for the endpoint's own use.
+        """
+        if item is None:
+            return None
+        trimmed = {key: value for key, value in item.items() if key in self.top}
+        for parent, children in self.nested.items():
+            if parent not in item:
+                continue
+            value = item[parent]
+            if children is not None and isinstance(value, dict):
+                value = {key: value[key] for key in children if key in value}
+            trimmed[parent] = value
+        return trimmed
+
+
+def parse_fields(query_string_parameters):
+    """
+    Returns:
+        Fields, or None when no fields parameter was given
+    Raises:
+        ValueError for a malformed list
+    """
+    value = (query_string_parameters or {}).get('fields')
+    if value is None:
+        return None
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    if not names or len(names) > MAX_FIELDS:
+        raise ValueError(f"fields must list 1 to {MAX_FIELDS} attribute names")
+    top, nested = [], {}
+    for name in names:
+        if not FIELD_PATTERN.match(name):
+            raise ValueError(f"Invalid field name: {name}")
+        if "." in name:
+            parent, child = name.split(".", 1)
+            nested.setdefault(parent, []).append(child)
+        elif name not in top:
+            top.append(name)
+    # "user_detail" next to "user_detail.name" asks for the whole object
+    for name in top:
+        if name in nested:
+            nested[name] = None
+    return Fields(top, nested)
+
+
+def projection_params(attributes):
+    """
+    ProjectionExpression for a list of attribute names, through placeholders
+    so reserved words like "name", "user" or "text" work.
+    """
+    if not attributes:
+        return {}
+    names = {f"#p{i}": attribute for i, attribute in enumerate(attributes)}
+    return {
+        'ProjectionExpression': ", ".join(names),
+        'ExpressionAttributeNames': names,
+    }
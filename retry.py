@@ -0,0 +1,64 @@
+import time
+import random
+import logging
+import threading
+
+# Backoff and adaptive concurrency for calls AWS throttles: bedrock-kb.py, rekognition_analyze.py,
+# bulk_load.py and like_counter.py in lambda/, parallel_scan.py and crud_dynamo.py at the
+# repository root. lambda/retry.py and retry.py are the same file, the two directories are
+# deployed as separate bundles.
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+# error codes of a throttled DynamoDB call
+DYNAMODB_THROTTLE_CODES = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
+
+
+def backoff_delay(attempt, base_seconds, max_seconds):
+    """
+    Seconds to wait before retry number attempt + 1, full jitter:
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
+
+
+def sleep_backoff(attempt, base_seconds, max_seconds):
+    time.sleep(backoff_delay(attempt, base_seconds, max_seconds))
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that halves on throttling and grows back by one slot
+    for every `limit` successful calls (AIMD), never above max_concurrency.
+    """
+
+    def __init__(self, max_concurrency, name="Calls"):
+        self.max_concurrency = max_concurrency
+        self.name = name
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+        return False
+
+    def success(self):
+        with self.condition:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def throttled(self):
+        with self.condition:
+            self.limit = max(1.0, self.limit / 2)
+            logger.warning(f"{self.name} throttled, concurrency limit lowered to {int(self.limit)}")
@@ -0,0 +1,13 @@
+import os
+import sys
+
+# The functions import their shared modules as top level modules, as they do in the
+# deployed bundles. Both directories are appended, not prepended, so the root logging.py
+# does not shadow the standard library module. Run `pytest tests` from the repository root,
+# `python -m pytest` puts the root first on sys.path.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "lambda")):
+    if path not in sys.path:
+        sys.path.append(path)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
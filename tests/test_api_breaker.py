@@ -0,0 +1,88 @@
+import time
+
+import pytest
+import requests
+
+import api
+from circuit_breaker import CircuitBreaker, MIN_CALLS
+from news_cache import Entry
+
+
+class UncachedNews:
+    """
+    Calls the loader on every get and has nothing to fall back on.
+    """
+
+    def get(self, key, loader):
+        body = loader()
+        return Entry(None, time.time(), body)
+
+    def peek(self, key):
+        return None
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}", response=self)
+
+
+@pytest.fixture
+def newsapi(monkeypatch):
+    calls = []
+    monkeypatch.setenv("NEWS_API_KEY", "key")
+    monkeypatch.setattr(api, "news_cache", UncachedNews())
+    monkeypatch.setattr(api, "newsapi_breaker", CircuitBreaker("newsapi", is_failure=api.newsapi_failure))
+
+    def respond_with(status_code):
+        def get(url, params, timeout):
+            calls.append(timeout)
+            return Response(status_code)
+        monkeypatch.setattr(api.session, "get", get)
+        return calls
+    return respond_with
+
+
+def test_client_errors_do_not_open_the_breaker(newsapi):
+    calls = newsapi(404)
+
+    for _ in range(MIN_CALLS * 2):
+        assert api.lambda_handler({}, None)['statusCode'] == 503
+
+    assert len(calls) == MIN_CALLS * 2
+
+
+@pytest.mark.parametrize("status_code", [500, 503, 429])
+def test_server_errors_and_rate_limiting_open_the_breaker(newsapi, status_code):
+    calls = newsapi(status_code)
+
+    for _ in range(MIN_CALLS * 2):
+        api.lambda_handler({}, None)
+
+    assert len(calls) == MIN_CALLS
+
+
+def test_timeout_is_capped_by_the_invocation_deadline(newsapi):
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return 1500
+
+    calls = newsapi(404)
+    api.lambda_handler({}, Context())
+
+    assert max(calls[0]) <= 1.0
+
+
+def test_no_call_without_time_left(newsapi):
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return 100
+
+    calls = newsapi(404)
+    response = api.lambda_handler({}, Context())
+
+    assert response['statusCode'] == 503
+    assert calls == []
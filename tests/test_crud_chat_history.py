@@ -0,0 +1,70 @@
+import importlib
+
+import pytest
+
+pytest.importorskip("langchain_community")
+
+
+class FakeBatch:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def delete_item(self, Key):
+        del self.table.items[(Key['user_id'], Key['time_creation'])]
+
+
+class FakeMemoryTable:
+    """
+    The conversation_memory table, partition key user_id and sort key time_creation,
+    queries return pages of PAGE_SIZE items.
+    """
+    PAGE_SIZE = 3
+
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, Item):
+        self.items[(Item['user_id'], Item['time_creation'])] = Item
+
+    def query(self, KeyConditionExpression, ScanIndexForward=True, Limit=None,
+              ProjectionExpression=None, ExclusiveStartKey=None):
+        user_id = KeyConditionExpression.get_expression()['values'][1]
+        rows = sorted((item for (owner, _), item in self.items.items() if owner == user_id),
+                      key=lambda item: item['time_creation'], reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            rows = [item for item in rows if item['time_creation'] > ExclusiveStartKey['time_creation']]
+        page = rows[:min(Limit or self.PAGE_SIZE, self.PAGE_SIZE)]
+        response = {'Items': page}
+        if len(rows) > len(page):
+            response['LastEvaluatedKey'] = {'user_id': user_id, 'time_creation': page[-1]['time_creation']}
+        return response
+
+    def batch_writer(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def crud(monkeypatch):
+    module = importlib.import_module("crud")
+    monkeypatch.setattr(module, "memory_table", FakeMemoryTable())
+    return module
+
+
+def test_clear_deletes_every_message_of_the_user(crud):
+    from langchain.schema import AIMessage, HumanMessage
+    History = crud.get_components()["History"]
+    history, other = History("u1", crud.MEMORY_WINDOW), History("u2", crud.MEMORY_WINDOW)
+    for i in range(4):
+        history.add_messages([HumanMessage(content=f"question {i}"), AIMessage(content=f"answer {i}")])
+    other.add_message(HumanMessage(content="kept"))
+
+    history.clear()
+
+    assert history.messages == []
+    assert [message.content for message in other.messages] == ["kept"]
@@ -0,0 +1,81 @@
+import importlib
+
+import label_index
+
+# what the S3 trigger of the image bucket is configured with
+LABELS_HANDLER = "crud.labels_handler"
+
+
+class FakeRekognition:
+    def detect_labels(self, Image, MaxLabels, MinConfidence):
+        assert Image == {'S3Object': {'Bucket': "images", 'Name': "uploads/u1/cat photo.jpg"}}
+        return {'Labels': [{'Name': "Cat", 'Confidence': 98.5}, {'Name': "Pet", 'Confidence': 91.25}]}
+
+
+class FakeBatch:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self.table.items[(Item['label'], Item['sk'])] = Item
+
+    def delete_item(self, Key):
+        self.table.items.pop((Key['label'], Key['sk']), None)
+
+
+class FakeLabelTable:
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get((Key['label'], Key['sk']))
+        return {'Item': item} if item else {}
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return FakeBatch(self)
+
+
+def s3_event(key):
+    return {'Records': [{'s3': {'bucket': {'name': "images"}, 'object': {'key': key}}}]}
+
+
+def deployed_handler():
+    module_name, function_name = LABELS_HANDLER.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def test_s3_event_writes_label_index_rows(monkeypatch):
+    crud = importlib.import_module("crud")
+    table = FakeLabelTable()
+    monkeypatch.setattr(label_index, "label_index_table", table)
+    monkeypatch.setattr(crud.boto3, "client", lambda service: FakeRekognition())
+
+    response = deployed_handler()(s3_event("uploads/u1/cat+photo.jpg"), None)
+
+    assert response['statusCode'] == 200
+    assert table.items[("cat", "098.50#images/uploads/u1/cat photo.jpg")]['image_key'] == "uploads/u1/cat photo.jpg"
+    assert ("pet", "091.25#images/uploads/u1/cat photo.jpg") in table.items
+    assert table.items[("__image__#images/uploads/u1/cat photo.jpg", "labels")]['entries'] == [
+        "cat|098.50#images/uploads/u1/cat photo.jpg",
+        "pet|091.25#images/uploads/u1/cat photo.jpg",
+    ]
+
+
+def test_chat_handler_does_not_replace_the_labels_handler():
+    crud = importlib.import_module("crud")
+    assert deployed_handler() is not crud.lambda_handler
+
+
+def test_variants_are_not_indexed(monkeypatch):
+    table = FakeLabelTable()
+    monkeypatch.setattr(label_index, "label_index_table", table)
+
+    deployed_handler()(s3_event("variants/feed/uploads/u1/cat.webp"), None)
+
+    assert table.items == {}
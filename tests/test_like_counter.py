@@ -0,0 +1,144 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import like_counter
+
+
+def conditional_check_failed():
+    return ClientError({'Error': {'Code': "ConditionalCheckFailedException", 'Message': ""}}, "UpdateItem")
+
+
+class FakeDynamoDB:
+    """
+    The counts table and the associated_id index of the likes table, for the calls
+    like_counter.py makes. on_query runs once, in the middle of the first index query.
+    """
+
+    def __init__(self, likes):
+        self.likes = dict(likes)
+        self.counts = {}
+        self.on_query = None
+
+    def likes_of(self, associated_id):
+        return self.counts.get(associated_id, {}).get('likes')
+
+    def get_item(self, TableName, Key, ConsistentRead):
+        item = self.counts.get(Key['id']['S'])
+        return {'Item': {name: {'N': str(value)} for name, value in item.items()}} if item else {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression=None):
+        item = self.counts.setdefault(Key['id']['S'], {})
+        if ConditionExpression == "attribute_not_exists(seed_started_at)":
+            if 'seed_started_at' in item:
+                raise conditional_check_failed()
+            item.update(likes=0, seed_started_at=int(ExpressionAttributeValues[':now']['N']))
+        else:
+            item['seeded_at'] = int(ExpressionAttributeValues[':now']['N'])
+
+    def query(self, TableName, IndexName, KeyConditionExpression, ExpressionAttributeValues, ProjectionExpression):
+        associated_id = ExpressionAttributeValues[':id']['S']
+        page = [{'id': {'S': like_id}} for like_id, target in self.likes.items() if target == associated_id]
+        if self.on_query:
+            on_query, self.on_query = self.on_query, None
+            on_query()
+        return {'Items': page}
+
+    def transact_write_items(self, TransactItems):
+        counter, actions = TransactItems[0]['Update'], TransactItems[1:]
+        reasons = [{'Code': "None"}]
+        for action in actions:
+            if 'Put' in action:
+                key = action['Put']['Item']['id']['S']
+                ok = key not in self.counts
+            else:
+                key = action['Update']['Key']['id']['S']
+                ok = self.counts.get(key, {}).get('state') == like_counter.COUNTED
+            reason = {'Code': "None" if ok else "ConditionalCheckFailed"}
+            if not ok and key in self.counts:
+                reason['Item'] = {'state': {'S': self.counts[key]['state']}}
+            reasons.append(reason)
+        if any(reason['Code'] != "None" for reason in reasons):
+            raise ClientError({'Error': {'Code': "TransactionCanceledException", 'Message': ""},
+                               'CancellationReasons': reasons}, "TransactWriteItems")
+        for action in actions:
+            if 'Put' in action:
+                item = action['Put']['Item']
+                self.counts[item['id']['S']] = {'state': item['state']['S']}
+            else:
+                self.counts[action['Update']['Key']['id']['S']]['state'] = like_counter.REMOVED
+        target = self.counts.setdefault(counter['Key']['id']['S'], {})
+        target['likes'] = target.get('likes', 0) + int(counter['ExpressionAttributeValues'][':net']['N'])
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    fake = FakeDynamoDB({"like-1": "post-1", "like-2": "post-1"})
+    monkeypatch.setattr(like_counter, "client", fake)
+    return fake
+
+
+def deliver(*events):
+    records = [{'messageId': str(i), 'body': json.dumps({"like_id": like_id, "associated_id": "post-1", "delta": delta})}
+               for i, (like_id, delta) in enumerate(events)]
+    return like_counter.lambda_handler({'Records': records}, None)
+
+
+def test_first_event_seeds_the_existing_likes(dynamodb):
+    dynamodb.likes["like-3"] = "post-1"
+
+    assert deliver(("like-3", 1)) == {"batchItemFailures": []}
+
+    assert dynamodb.likes_of("post-1") == 3
+    assert 'seeded_at' in dynamodb.counts["post-1"]
+
+
+def test_like_written_while_seeding_is_counted_once(dynamodb):
+    def like_during_seed():
+        # the like is in the table the seed reads, its event is handled by another
+        # consumer before the seed gets to apply it
+        dynamodb.likes["like-3"] = "post-1"
+        deliver(("like-3", 1))
+
+    dynamodb.on_query = like_during_seed
+    deliver(("like-1", 1))
+
+    assert dynamodb.likes_of("post-1") == 3
+
+
+def test_unlike_while_seeding_is_subtracted_once(dynamodb):
+    def unlike_during_seed():
+        del dynamodb.likes["like-2"]
+        deliver(("like-2", -1))
+
+    dynamodb.on_query = unlike_during_seed
+    deliver(("like-1", 1))
+
+    assert dynamodb.likes_of("post-1") == 1
+
+
+def test_unlike_before_its_like_event_counts_neither(dynamodb):
+    deliver(("like-1", 1))
+
+    deliver(("like-9", -1))
+    deliver(("like-9", 1))
+
+    assert dynamodb.likes_of("post-1") == 2
+
+
+def test_redelivered_events_count_once(dynamodb):
+    deliver(("like-3", 1), ("like-3", 1))
+    deliver(("like-3", 1))
+    deliver(("like-1", -1), ("like-1", -1))
+    deliver(("like-1", -1))
+
+    assert dynamodb.likes_of("post-1") == 2
+
+
+def test_like_and_unlike_in_one_batch(dynamodb):
+    deliver(("like-1", 1))
+
+    deliver(("like-5", 1), ("like-5", -1))
+
+    assert dynamodb.likes_of("post-1") == 2
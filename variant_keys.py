@@ -0,0 +1,45 @@
+# Keys and urls of the resized image variants made by image_variants.py at the repository
+# root, for the functions that read them: posts.py, my-profile.py and rekognition_analyze.py
+# in lambda/. lambda/variant_keys.py and variant_keys.py are the same file, the two
+# directories are deployed as separate bundles.
+
+# every variant is written under this prefix, lambda-handle-sqs.py skips notifications for it
+VARIANT_PREFIX = "variants/"
+
+# name -> image format, rekognition only reads JPEG and PNG, the analysis variant stays JPEG
+VARIANT_FORMATS = {
+    "thumbnail": "WEBP",
+    "feed": "WEBP",
+    "analysis": "JPEG",
+}
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+
+def variant_key(object_key, name):
+    base = object_key.rsplit(".", 1)[0]
+    return f"{VARIANT_PREFIX}{name}/{base}.{EXTENSIONS[VARIANT_FORMATS[name]]}"
+
+
+def is_variant(object_key):
+    return object_key.startswith(VARIANT_PREFIX)
+
+
+def variant_urls(bucket_name, object_key):
+    """
+    Returns:
+        dict of variant name -> url, as lambda-handle-sqs.py stores them in profile_image_variants
+    """
+    return {name: f"https://{bucket_name}.s3.amazonaws.com/{variant_key(object_key, name)}"
+            for name in VARIANT_FORMATS}
+
+
+def with_image_variant(user_item, variant):
+    """
+    Points profile_image_url at a resized variant when one exists.
+    Variants are created by lambda-handle-sqs.py, "original" keeps the full size image.
+    """
+    variants = user_item.get('profile_image_variants') or {}
+    if variant != 'original' and variant in variants:
+        user_item['profile_image_original_url'] = user_item.get('profile_image_url')
+        user_item['profile_image_url'] = variants[variant]
+    return user_item